@@ -0,0 +1,649 @@
+import contextlib
+import email.utils
+import hashlib
+import http.client
+import json
+import os
+import itertools
+import random
+import re
+import select
+import sqlite3
+import subprocess
+import threading
+import time
+import urllib.parse
+
+import github_trace
+
+try:
+    from nacl import encoding, public
+except ImportError:
+    public = None
+
+# Pluggable transport for GitHub REST calls. The default HTTP transport keeps
+# one keep-alive connection per thread and reuses the token gh is logged in
+# with; the gh transport shells out to `gh api` and is used when no token is
+# available or GITHUB_TOOL_TRANSPORT=gh. GITHUB_API_URL points either one at
+# another server, such as a local stub.
+DEFAULT_API_URL = "https://api.github.com"
+API_VERSION = "2022-11-28"
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+
+_token = None
+_transport = None
+_transport_lock = threading.Lock()
+_scheduler = None
+_response_cache = None
+_response_cache_enabled = os.environ.get("GITHUB_TOOL_NO_CACHE", "") in ("", "0")
+
+class APIError(Exception):
+    pass
+
+class Response:
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    @property
+    def ok(self):
+        return 200 <= self.status < 300
+
+    def json(self):
+        return json.loads(self.body) if self.body else None
+
+    def error_message(self):
+        try:
+            return self.json().get("message", "")
+        except (ValueError, AttributeError):
+            return self.body.decode("utf-8", "replace").strip()
+
+class HTTPTransport:
+    name = "http"
+
+    def __init__(self, base_url, token, timeout=30):
+        parsed = urllib.parse.urlsplit(base_url)
+        self.base_url = base_url.rstrip("/")
+        self.https = parsed.scheme == "https"
+        self.host = parsed.hostname
+        self.port = parsed.port
+        self.prefix = parsed.path.rstrip("/")
+        self.token = token
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is not None and conn.sock is not None and select.select([conn.sock], [], [], 0)[0]:
+            # An idle keep-alive socket only turns readable when the server
+            # has closed it; reconnecting up front saves a POST from failing
+            conn.close()
+            conn = None
+        if conn is None:
+            connection_class = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            conn = connection_class(self.host, self.port, timeout=self.timeout)
+            self.local.conn = conn
+        return conn
+
+    def target(self, path):
+        # Pagination links come back as absolute URLs on the same host
+        if path.startswith(self.base_url):
+            path = path[len(self.base_url):]
+        return self.prefix + "/" + path.lstrip("/")
+
+    def request(self, method, path, body=None, headers=None):
+        request_headers = {
+            "Accept": "application/vnd.github+json",
+            "User-Agent": "github_automate_tool",
+            "X-GitHub-Api-Version": API_VERSION,
+        }
+        if self.token:
+            request_headers["Authorization"] = f"Bearer {self.token}"
+        data = None
+        if body is not None:
+            data = json.dumps(body).encode()
+            request_headers["Content-Type"] = "application/json"
+        request_headers.update(headers or {})
+
+        for attempt in range(2):
+            conn = self.connection()
+            try:
+                conn.request(method, self.target(path), body=data, headers=request_headers)
+            except (http.client.CannotSendRequest, ConnectionResetError, BrokenPipeError):
+                # The server closed an idle keep-alive connection before the
+                # request got through; reconnect once
+                conn.close()
+                self.local.conn = None
+                if attempt:
+                    raise
+                continue
+            try:
+                response = conn.getresponse()
+                payload = response.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError):
+                # The request may already have been applied, so only methods
+                # that are safe to repeat are sent again
+                conn.close()
+                self.local.conn = None
+                if attempt or method not in IDEMPOTENT_METHODS:
+                    raise
+                continue
+            if response.will_close:
+                conn.close()
+                self.local.conn = None
+            return Response(response.status, {key.lower(): value for key, value in response.getheaders()}, payload)
+
+    def close(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self.local.conn = None
+
+class GhTransport:
+    name = "gh"
+
+    def __init__(self, base_url=DEFAULT_API_URL):
+        self.base_url = base_url.rstrip("/")
+
+    def request(self, method, path, body=None, headers=None):
+        if path.startswith(self.base_url):
+            path = path[len(self.base_url):]
+        command = ["gh", "api", "--include", "--method", method, path.lstrip("/")]
+        for key, value in (headers or {}).items():
+            command += ["--header", f"{key}: {value}"]
+        data = None
+        if body is not None:
+            command += ["--input", "-"]
+            data = json.dumps(body).encode()
+        result = subprocess.run(command, input=data, capture_output=True)
+        return parse_included_response(result.stdout)
+
+    def close(self):
+        pass
+
+def parse_included_response(output):
+    # `gh api --include` prints the status line and headers before the body
+    head, _, body = output.replace(b"\r\n", b"\n").partition(b"\n\n")
+    lines = head.decode("utf-8", "replace").splitlines()
+    try:
+        status = int(lines[0].split()[1])
+    except (IndexError, ValueError):
+        return Response(599, {}, output)
+    headers = {}
+    for line in lines[1:]:
+        key, _, value = line.partition(":")
+        headers[key.strip().lower()] = value.strip()
+    return Response(status, headers, body)
+
+def get_token():
+    global _token
+    if _token is None:
+        _token = os.environ.get("GH_TOKEN") or os.environ.get("GITHUB_TOKEN") or ""
+        if not _token:
+            try:
+                result = subprocess.run(["gh", "auth", "token"], text=True, capture_output=True)
+                _token = result.stdout.strip() if result.returncode == 0 else ""
+            except FileNotFoundError:
+                pass
+    return _token
+
+def reset_auth():
+    # Called when the gh login changes under a long-running process: the next
+    # call picks up the new token and opens a connection with it
+    global _token
+    _token = None
+    set_transport(None)
+
+def get_api_url():
+    return os.environ.get("GITHUB_API_URL") or DEFAULT_API_URL
+
+def create_transport(kind=None):
+    kind = kind or os.environ.get("GITHUB_TOOL_TRANSPORT") or "http"
+    if kind == "http":
+        token = get_token()
+        if token or get_api_url() != DEFAULT_API_URL:
+            return HTTPTransport(get_api_url(), token)
+    return GhTransport(get_api_url())
+
+def get_transport():
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            _transport = create_transport()
+        return _transport
+
+def set_transport(transport):
+    global _transport
+    with _transport_lock:
+        if _transport is not None and _transport is not transport:
+            _transport.close()
+        _transport = transport
+
+@contextlib.contextmanager
+def transport_override(transport):
+    # Uses `transport` for the duration of one command and then puts the
+    # long-lived one back untouched; None leaves the current transport in place
+    global _transport
+    if transport is None:
+        yield
+        return
+    with _transport_lock:
+        previous, _transport = _transport, transport
+    try:
+        yield
+    finally:
+        with _transport_lock:
+            _transport = previous
+        transport.close()
+
+class Scheduler:
+    # Every API request goes through one scheduler per process. It paces
+    # requests with a token bucket per rate-limit resource (core, graphql,
+    # search), follows that resource's x-ratelimit-* headers so its remaining
+    # quota is spread until the reset time, and honours Retry-After (or
+    # exponential backoff with jitter) on 403/429 rate-limit responses.
+    # Concurrency grows by one after a run of successes and halves on every
+    # rate-limit response.
+    def __init__(self, rate=10.0, burst=20, concurrency=4, max_concurrency=32, max_retries=5):
+        self.condition = threading.Condition()
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}
+        self.limit = concurrency
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.active = 0
+        self.successes = 0
+        self.blocked_until = 0.0
+        self.quota = {}
+
+    def effective_rate(self, resource, now):
+        # Once a quota runs low, spend what is left evenly until it resets
+        rate = self.rate
+        limit, remaining, reset = self.quota.get(resource, (0, 0, 0))
+        if reset > now and 0 < remaining < limit * 0.1:
+            rate = min(rate, remaining / (reset - now))
+        return rate
+
+    def resource_blocked_until(self, resource, now):
+        # An exhausted quota blocks only its own resource, until it resets
+        blocked_until = self.blocked_until
+        limit, remaining, reset = self.quota.get(resource, (0, 1, 0))
+        if remaining <= 0 and reset > now:
+            blocked_until = max(blocked_until, reset)
+        return blocked_until
+
+    def acquire(self, resource="core"):
+        with self.condition:
+            while self.active >= self.limit:
+                self.condition.wait()
+            self.active += 1
+            # Take a token, sleeping while the bucket refills
+            while True:
+                now = time.time()
+                now_monotonic = time.monotonic()
+                rate = self.effective_rate(resource, now)
+                tokens, refilled_at = self.buckets.get(resource, (self.burst, now_monotonic))
+                tokens = min(self.burst, tokens + (now_monotonic - refilled_at) * rate)
+                wait = max(self.resource_blocked_until(resource, now) - now, 0)
+                if tokens >= 1 and not wait:
+                    self.buckets[resource] = (tokens - 1, now_monotonic)
+                    return
+                self.buckets[resource] = (tokens, now_monotonic)
+                wait = wait or (1 - tokens) / rate
+                # Nothing notifies when a quota resets, so never sleep past one
+                resets = [reset - now for _, _, reset in self.quota.values() if reset > now]
+                if resets:
+                    wait = min(wait, max(min(resets), 0.01))
+                self.condition.wait(wait)
+
+    def release(self):
+        with self.condition:
+            self.active -= 1
+            self.condition.notify_all()
+
+    def observe(self, response, limited):
+        with self.condition:
+            limit = response.headers.get("x-ratelimit-limit")
+            remaining = response.headers.get("x-ratelimit-remaining")
+            reset = response.headers.get("x-ratelimit-reset")
+            if limit is not None and remaining is not None and reset is not None:
+                resource = response.headers.get("x-ratelimit-resource", "core")
+                with contextlib.suppress(ValueError):
+                    self.quota[resource] = (int(limit), int(remaining), int(reset))
+            if limited:
+                self.limit = max(1, self.limit // 2)
+                self.successes = 0
+            elif response.ok:
+                self.successes += 1
+                if self.successes >= self.limit and self.limit < self.max_concurrency:
+                    self.limit += 1
+                    self.successes = 0
+            self.condition.notify_all()
+
+    def block(self, delay):
+        # Secondary rate limits apply to the whole account, so every thread
+        # pauses whatever resource it is waiting for
+        with self.condition:
+            self.blocked_until = max(self.blocked_until, time.time() + delay)
+            self.condition.notify_all()
+
+    def retry_delay(self, response, attempt):
+        # Returns (delay, account_wide) or None when the response is final
+        if response.status not in (403, 429):
+            return None
+        retry_after = parse_retry_after(response.headers.get("retry-after"))
+        if retry_after is not None:
+            return retry_after + random.uniform(0, 1), True
+        if response.headers.get("x-ratelimit-remaining") == "0":
+            # observe() blocks the exhausted resource until its reset
+            return random.uniform(1, 3), False
+        if response.status == 429 or "rate limit" in response.error_message().lower():
+            return random.uniform(1, min(60, 2 ** (attempt + 1))), True
+        # An ordinary 403 (missing permission) is not worth retrying
+        return None
+
+    def execute(self, send, resource="core"):
+        for attempt in range(self.max_retries + 1):
+            self.acquire(resource)
+            try:
+                response = send()
+            finally:
+                self.release()
+            retry = self.retry_delay(response, attempt)
+            self.observe(response, limited=retry is not None)
+            if retry is None or attempt == self.max_retries:
+                return response
+            delay, account_wide = retry
+            if account_wide:
+                self.block(delay)
+            else:
+                time.sleep(delay)
+        return response
+
+def parse_retry_after(value):
+    # Retry-After is either a number of seconds or an HTTP date
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0)
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+def get_rate_limit_resource(path):
+    # The x-ratelimit-resource a request is counted against
+    path = urllib.parse.urlsplit(path).path.strip("/")
+    if path == "graphql" or path.endswith("/graphql"):
+        return "graphql"
+    if path.startswith("search/") or "/search/" in path:
+        return "search"
+    return "core"
+
+class ResponseCache:
+    # On-disk cache of GET responses keyed by URL and token. Stored ETag and
+    # Last-Modified values turn repeat requests into conditional ones; a 304
+    # carries no body and does not count against the primary rate limit.
+    # Least recently used entries are evicted once the bodies exceed max_bytes.
+    def __init__(self, path, max_bytes=64 * 1024 * 1024):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, headers TEXT, body BLOB, size INTEGER, used_at REAL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_used_at ON responses (used_at)")
+
+    def lookup(self, key):
+        with self.lock:
+            row = self.conn.execute("SELECT etag, last_modified, headers, body FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        etag, last_modified, headers, body = row
+        return etag, last_modified, json.loads(headers), body
+
+    def touch(self, key):
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE responses SET used_at = ? WHERE key = ?", (time.time(), key))
+
+    def store(self, key, response):
+        etag = response.headers.get("etag")
+        last_modified = response.headers.get("last-modified")
+        if not etag and not last_modified:
+            return
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)", (key, etag, last_modified, json.dumps(response.headers), response.body, len(response.body), time.time()))
+            self.evict()
+
+    def evict(self):
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self.conn.execute("SELECT key, size FROM responses ORDER BY used_at").fetchall():
+            self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+def get_cache_dir():
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(cache_home, "github_automate_tool")
+
+def get_response_cache():
+    global _response_cache
+    with _transport_lock:
+        if _response_cache is None and _response_cache_enabled:
+            _response_cache = ResponseCache(os.path.join(get_cache_dir(), "http_cache.sqlite"))
+        return _response_cache
+
+def response_cache_enabled():
+    return _response_cache_enabled
+
+def set_response_cache_enabled(enabled):
+    global _response_cache_enabled, _response_cache
+    with _transport_lock:
+        _response_cache_enabled = enabled
+        if not enabled:
+            _response_cache = None
+
+def get_cache_key(transport, path):
+    # Responses depend on who is asking, so the token is part of the key
+    token_id = hashlib.sha256(get_token().encode()).hexdigest()[:16]
+    return f"{transport.name}:{getattr(transport, 'base_url', '')}:{token_id}:{path.lstrip('/')}"
+
+def get_scheduler():
+    global _scheduler
+    with _transport_lock:
+        if _scheduler is None:
+            _scheduler = Scheduler(
+                rate=float(os.environ.get("GITHUB_TOOL_RATE", "10")),
+                concurrency=int(os.environ.get("GITHUB_TOOL_CONCURRENCY", "4")),
+            )
+        return _scheduler
+
+def request(method, path, body=None, headers=None):
+    transport = get_transport()
+    cache = get_response_cache() if method == "GET" else None
+    cached = None
+    if cache:
+        key = get_cache_key(transport, path)
+        cached = cache.lookup(key)
+        if cached:
+            etag, last_modified, _, _ = cached
+            headers = dict(headers or {})
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+
+    with github_trace.command(f"{transport.name} {method} {path}", kind="api") as call:
+        response = get_scheduler().execute(lambda: transport.request(method, path, body, headers), get_rate_limit_resource(path))
+        call.status = response.status
+        call.stdout_bytes = github_trace.byte_length(response.body)
+    if cache:
+        if response.status == 304 and cached:
+            cache.touch(key)
+            # Keep the fresh rate-limit headers but serve the stored body
+            return Response(200, {**cached[2], **response.headers}, cached[3])
+        if response.status == 200:
+            cache.store(key, response)
+    return response
+
+def call_api(method, path, body=None, headers=None):
+    # Returns the response when it succeeded, otherwise reports the error in
+    # the same shape as run_command and returns None
+    try:
+        response = request(method, path, body, headers)
+    except (OSError, http.client.HTTPException) as e:
+        print(f"Error calling GitHub API: {method} {path}")
+        print(f"Error message: {e}")
+        return None
+    if not response.ok:
+        print(f"Error calling GitHub API: {method} {path} (HTTP {response.status})")
+        print(f"Error message: {response.error_message()}")
+        return None
+    return response
+
+def get_next_link(link_header):
+    match = re.search(r'<([^>]+)>;\s*rel="next"', link_header or "")
+    return match.group(1) if match else None
+
+def iter_items(path, params=None, limit=None):
+    # Lazily walks a paginated listing: each page is requested only when the
+    # consumer has used up the previous one, so stopping early (limit, a
+    # filter, Ctrl-C) skips the remaining pages entirely
+    query = urllib.parse.urlencode({"per_page": 100, **(params or {})})
+    url = f"{path}?{query}"
+
+    def pages(url):
+        while url:
+            response = request("GET", url)
+            if not response.ok:
+                raise APIError(f"GET {path} (HTTP {response.status}): {response.error_message()}")
+            data = response.json()
+            yield data
+            url = get_next_link(response.headers.get("link"))
+
+    items = itertools.chain.from_iterable(pages(url))
+    return itertools.islice(items, limit) if limit else items
+
+# Batched GraphQL lookups. Each repository becomes an aliased
+# `repository(...)` field, so one request answers for a whole batch; counts
+# come from totalCount instead of listing every pull request or issue.
+GRAPHQL_BATCH_SIZE = 100
+REPO_STATS_FIELDS = """
+    stargazerCount
+    forkCount
+    watchers { totalCount }
+    openPullRequests: pullRequests(states: OPEN) { totalCount }
+    closedPullRequests: pullRequests(states: [CLOSED, MERGED]) { totalCount }
+    openIssues: issues(states: OPEN) { totalCount }
+    closedIssues: issues(states: CLOSED) { totalCount }
+"""
+
+class BatchTooLarge(Exception):
+    pass
+
+def graphql(query, variables=None):
+    response = request("POST", "graphql", {"query": query, "variables": variables or {}})
+    # Over-complex or slow queries come back as 502/504 or as errors that
+    # mention the node or complexity limit; callers split the batch
+    if response.status in (502, 504):
+        raise BatchTooLarge(f"HTTP {response.status}")
+    data = response.json() if response.body else {}
+    for error in data.get("errors") or []:
+        if error.get("type") in ("MAX_NODE_LIMIT_EXCEEDED", "RESOURCE_LIMITS_EXCEEDED") or "complex" in error.get("message", ""):
+            raise BatchTooLarge(error.get("message", ""))
+    if not response.ok:
+        raise OSError(f"HTTP {response.status}: {response.error_message()}")
+    return data
+
+def build_repo_stats_query(full_names):
+    params = []
+    fields = []
+    variables = {}
+    for i, full_name in enumerate(full_names):
+        owner, name = full_name.split("/", 1)
+        variables[f"owner{i}"] = owner
+        variables[f"name{i}"] = name
+        params.append(f"$owner{i}: String!, $name{i}: String!")
+        fields.append(f"r{i}: repository(owner: $owner{i}, name: $name{i}) {{{REPO_STATS_FIELDS}}}")
+    query = f"query({', '.join(params)}) {{\n" + "\n".join(fields) + "\n}"
+    return query, variables
+
+def parse_repo_stats(node):
+    if node is None:
+        return None
+    return {
+        "stars": node["stargazerCount"],
+        "forks": node["forkCount"],
+        "watchers": node["watchers"]["totalCount"],
+        "open_pull_requests": node["openPullRequests"]["totalCount"],
+        "closed_pull_requests": node["closedPullRequests"]["totalCount"],
+        "open_issues": node["openIssues"]["totalCount"],
+        "closed_issues": node["closedIssues"]["totalCount"],
+    }
+
+def fetch_repo_stats_batch(full_names):
+    try:
+        data = graphql(*build_repo_stats_query(full_names))
+    except BatchTooLarge:
+        if len(full_names) == 1:
+            return {full_names[0]: None}
+        middle = len(full_names) // 2
+        stats = fetch_repo_stats_batch(full_names[:middle])
+        stats.update(fetch_repo_stats_batch(full_names[middle:]))
+        return stats
+    # Missing or inaccessible repositories come back as null with an error
+    # entry, without failing the rest of the batch
+    nodes = data.get("data") or {}
+    return {full_name: parse_repo_stats(nodes.get(f"r{i}")) for i, full_name in enumerate(full_names)}
+
+def fetch_repo_stats(full_names, batch_size=GRAPHQL_BATCH_SIZE):
+    # Returns {"owner/name": stats or None} for every requested repository
+    full_names = list(dict.fromkeys(full_names))
+    stats = {}
+    for start in range(0, len(full_names), batch_size):
+        batch = full_names[start:start + batch_size]
+        try:
+            stats.update(fetch_repo_stats_batch(batch))
+        except (OSError, http.client.HTTPException) as e:
+            print(f"Error calling GitHub GraphQL API: {e}")
+            stats.update(dict.fromkeys(batch))
+    return stats
+
+# Actions secrets are sealed locally with the repository's public key
+# (libsodium sealed box, via PyNaCl) so the plaintext never leaves the process
+def can_seal_secrets():
+    return public is not None
+
+def get_secret_public_key(full_name, public_keys=None):
+    # Returns (key_id, key) or None. `public_keys` is the caller's cache for
+    # one batch of uploads; failures are not cached so the next secret retries,
+    # and a rotated key is picked up by the next batch
+    if public_keys is not None and full_name in public_keys:
+        return public_keys[full_name]
+    response = call_api("GET", f"repos/{full_name}/actions/secrets/public-key")
+    if not response:
+        return None
+    data = response.json()
+    key = (data["key_id"], data["key"])
+    if public_keys is not None:
+        public_keys[full_name] = key
+    return key
+
+def seal_secret(key, value):
+    sealed_box = public.SealedBox(public.PublicKey(key.encode(), encoding.Base64Encoder()))
+    return sealed_box.encrypt(value.encode(), encoding.Base64Encoder()).decode()
+
+def put_secret(full_name, secret_name, value, public_keys=None):
+    public_key = get_secret_public_key(full_name, public_keys)
+    if not public_key:
+        return False
+    key_id, key = public_key
+    body = {"encrypted_value": seal_secret(key, value), "key_id": key_id}
+    return call_api("PUT", f"repos/{full_name}/actions/secrets/{secret_name}", body) is not None
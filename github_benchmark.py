@@ -0,0 +1,555 @@
+import argparse
+import cProfile
+import http.server
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import github_metrics
+
+# Benchmarks for github_metrics.py and github_tool.py. Synthetic repositories
+# are generated with `git fast-import`, and GitHub is replaced by a fake `gh`
+# on PATH that answers `gh api --include` from canned data and creates local
+# bare repositories for `gh repo create`, so nothing touches the network.
+# github.com clone URLs resolve to local bare remotes through insteadOf. The
+# API cases also run over the default HTTP transport against a local stub
+# that serves the same canned data.
+TOOL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "github_tool.py")
+METRICS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "github_metrics.py")
+LOGIN = "bench"
+
+# Canned GitHub REST and GraphQL answers, shared by the fake gh (as a module
+# next to it) and the in-process HTTP stub
+FAKE_API = r'''
+import hashlib, json, os, re, urllib.parse
+
+repo_count = int(os.environ.get("BENCH_GH_REPOS", "50"))
+login = os.environ.get("BENCH_GH_LOGIN", "bench")
+PUBLIC_KEY = "AQIDBAUGBwgJCgsMDQ4PEBESExQVFhcYGRobHB0eHyA="
+
+def item_list(path):
+    if path == "user/repos":
+        return [{"full_name": f"{login}/repo-{i}", "name": f"repo-{i}", "private": i % 3 == 0, "description": ""} for i in range(repo_count)]
+    if path == "gists":
+        return [{"id": f"g{i}", "description": f"gist {i}", "public": False} for i in range(repo_count)]
+    if path == "notifications":
+        return []
+    if re.fullmatch(r"repos/[^/]+/[^/]+/pulls", path):
+        return [{"number": i, "title": f"PR {i}", "state": "open"} for i in range(repo_count)]
+    if re.fullmatch(r"repos/[^/]+/[^/]+/issues", path):
+        return [{"number": i, "title": f"Issue {i}", "state": "open", **({"pull_request": {}} if i % 4 == 0 else {})} for i in range(repo_count)]
+    return None
+
+def item(path):
+    if re.fullmatch(r"repos/[^/]+/[^/]+/actions/secrets/public-key", path):
+        return {"key_id": "bench", "key": PUBLIC_KEY}
+    return None
+
+def graphql(body):
+    count = {"totalCount": 1}
+    node = {"stargazerCount": 1, "forkCount": 1, "watchers": count, "openPullRequests": count, "closedPullRequests": count, "openIssues": count, "closedIssues": count}
+    return {"data": {alias: node for alias in re.findall(r"\b(r\d+):", body["query"])}}
+
+def cacheable(body, headers, request_headers):
+    # Like GitHub, every GET carries an ETag and a matching If-None-Match
+    # gets an empty 304, so the tool's response cache has something to save
+    etag = '"' + hashlib.sha1(json.dumps(body).encode()).hexdigest() + '"'
+    headers = [*headers, ("ETag", etag)]
+    if request_headers.get("if-none-match") == etag:
+        return 304, headers, None
+    return 200, headers, body
+
+def handle(method, url, request_headers, body, base_url="https://api.github.com"):
+    # Returns (status, [(header, value)], JSON body or None); request_headers
+    # has lower-case names
+    parts = urllib.parse.urlsplit(url)
+    path = parts.path.strip("/")
+    params = dict(urllib.parse.parse_qsl(parts.query))
+    if path == "graphql":
+        return 200, [], graphql(json.loads(body))
+    if method == "DELETE":
+        return 204, [], None
+    if method != "GET":
+        return 200, [], {"html_url": f"https://github.com/{login}/x"}
+    if item(path) is not None:
+        return cacheable(item(path), [], request_headers)
+    items = item_list(path)
+    if items is None:
+        return 404, [], {"message": "Not Found"}
+    page, per_page = int(params.get("page", 1)), int(params.get("per_page", 30))
+    headers = []
+    if page * per_page < len(items):
+        next_query = urllib.parse.urlencode({**params, "page": page + 1})
+        headers.append(("Link", f'<{base_url}/{path}?{next_query}>; rel="next"'))
+    return cacheable(items[(page - 1) * per_page:page * per_page], headers, request_headers)
+'''
+
+FAKE_GH = r'''#!{python}
+import json, os, subprocess, sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fake_api
+
+state_dir = os.environ["BENCH_GH_DIR"]
+login = fake_api.login
+
+def api(args):
+    method, path, body = "GET", None, None
+    request_headers = {{}}
+    while args:
+        arg = args.pop(0)
+        if arg == "--method":
+            method = args.pop(0)
+        elif arg in ("--header", "-H"):
+            key, _, value = args.pop(0).partition(":")
+            request_headers[key.strip().lower()] = value.strip()
+        elif arg == "--input":
+            args.pop(0)
+            body = sys.stdin.read()
+        elif not arg.startswith("-"):
+            path = arg
+    status, headers, payload = fake_api.handle(method, path, request_headers, body)
+    sys.stdout.write(f"HTTP/2.0 {{status}} {{'OK' if status < 400 else 'Error'}}\n")
+    for key, value in headers:
+        sys.stdout.write(f"{{key}}: {{value}}\n")
+    sys.stdout.write("Content-Type: application/json\n\n" + ("" if payload is None else json.dumps(payload)))
+
+args = sys.argv[1:]
+if args[:1] == ["--version"]:
+    print("gh version 2.0.0 (benchmark)")
+elif args[:2] == ["auth", "status"]:
+    pass
+elif args[:2] == ["auth", "token"]:
+    sys.exit(1)
+elif args[:2] == ["api", "user"]:
+    print(login)
+elif args[:1] == ["api"] and "--include" in args:
+    api(args[1:])
+elif args[:2] == ["secret", "set"]:
+    sys.stdin.read()
+elif args[:2] == ["repo", "create"]:
+    name = args[2]
+    subprocess.run(["git", "init", "-q", "--bare", os.path.join(state_dir, "remotes", name + ".git")], check=True)
+    subprocess.run(["git", "remote", "add", "origin", f"https://github.com/{{login}}/{{name}}.git"], check=True)
+    print(f"https://github.com/{{login}}/{{name}}")
+else:
+    sys.stderr.write("fake gh: unsupported command: " + " ".join(args) + "\n")
+    sys.exit(1)
+'''
+
+class FakeAPIHandler(http.server.BaseHTTPRequestHandler):
+    # Serves FAKE_API over keep-alive HTTP/1.1 for the default HTTPTransport
+    protocol_version = "HTTP/1.1"
+
+    def handle_request(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length).decode() if length else None
+        request_headers = {key.lower(): value for key, value in self.headers.items()}
+        status, headers, payload = self.server.api["handle"](self.command, self.path, request_headers, body, self.server.base_url)
+        data = b"" if payload is None else json.dumps(payload).encode()
+        self.send_response(status)
+        for key, value in headers:
+            self.send_header(key, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = handle_request
+
+    def log_message(self, format, *args):
+        pass
+
+def start_api_stub(repo_count):
+    # Runs in a thread of the benchmark process; shut down by the caller
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), FakeAPIHandler)
+    server.daemon_threads = True
+    server.api = {}
+    exec(FAKE_API, server.api)
+    server.api.update(repo_count=repo_count, login=LOGIN)
+    server.base_url = f"http://127.0.0.1:{server.server_port}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def write_fast_import_stream(out, commits, branches, files, authors, seed):
+    # Deterministic history: an initial commit with every file, then commits
+    # on main touching a few files each, then one commit per topic branch
+    # forked from an earlier point of main
+    rng = random.Random(seed)
+    now = int(time.time())
+    start = now - 400 * 86400
+    step = max(1, (now - start) // max(commits, 1))
+    paths = [f"src/dir{i % 10}/file{i}.txt" for i in range(files)]
+
+    def blob(lines):
+        data = "".join(f"line {rng.randrange(1 << 30)}\n" for _ in range(lines)).encode()
+        out.write(f"data {len(data)}\n".encode() + data + b"\n")
+
+    def commit(ref, mark, parent, when, message, changed):
+        author = rng.randrange(authors)
+        message = message.encode()
+        out.write(f"commit {ref}\nmark :{mark}\n".encode())
+        out.write(f"author Author {author} <author{author}@example.com> {when} +0000\n".encode())
+        out.write(f"committer Author {author} <author{author}@example.com> {when} +0000\n".encode())
+        out.write(f"data {len(message)}\n".encode() + message + b"\n")
+        if parent:
+            out.write(f"from :{parent}\n".encode())
+        for path in changed:
+            out.write(f"M 100644 inline {path}\n".encode())
+            blob(rng.randint(1, 40))
+        out.write(b"\n")
+
+    commit("refs/heads/main", 1, None, start, "Initial commit", paths)
+    for i in range(2, commits + 1):
+        message = f"{'fix' if i % 7 == 0 else 'Update'} {rng.choice(paths)} ({i})"
+        commit("refs/heads/main", i, i - 1, start + i * step, message, rng.sample(paths, min(3, len(paths))))
+    for b in range(branches):
+        fork_point = rng.randint(1, commits)
+        commit(f"refs/heads/topic-{b}", commits + 1 + b, fork_point, start + fork_point * step + 60, f"Topic work {b}", rng.sample(paths, 1))
+
+def make_repo(path, commits=500, branches=10, files=200, authors=5, seed=0):
+    os.makedirs(path)
+    subprocess.run(["git", "init", "-q", "-b", "main", path], check=True)
+    process = subprocess.Popen(["git", "fast-import", "--quiet"], cwd=path, stdin=subprocess.PIPE)
+    write_fast_import_stream(process.stdin, commits, branches, files, authors, seed)
+    process.stdin.close()
+    if process.wait() != 0:
+        raise RuntimeError(f"git fast-import failed for {path}")
+    subprocess.run(["git", "reset", "-q", "--hard", "main"], cwd=path, check=True)
+    with open(os.path.join(path, ".gitignore"), "w") as f:
+        f.write("*.log\n")
+    with open(os.path.join(path, "build.log"), "w") as f:
+        f.write("ignored\n")
+    return path
+
+def make_environment(root, repo_count):
+    # A self-contained HOME, cache and git config with the fake gh first on
+    # PATH; github.com URLs for the benchmark login resolve to local remotes
+    bin_dir = os.path.join(root, "bin")
+    os.makedirs(bin_dir)
+    os.makedirs(os.path.join(root, "remotes"))
+    gh_path = os.path.join(bin_dir, "gh")
+    with open(gh_path, "w") as f:
+        f.write(FAKE_GH.format(python=sys.executable))
+    os.chmod(gh_path, 0o755)
+    with open(os.path.join(bin_dir, "fake_api.py"), "w") as f:
+        f.write(FAKE_API)
+    gitconfig = os.path.join(root, "gitconfig")
+    with open(gitconfig, "w") as f:
+        f.write(f'[url "{os.path.join(root, "remotes")}/"]\n\tinsteadOf = https://github.com/{LOGIN}/\n')
+        f.write("[user]\n\tname = Benchmark\n\temail = bench@example.com\n[init]\n\tdefaultBranch = main\n")
+    env = {key: value for key, value in os.environ.items() if key not in ("GH_TOKEN", "GITHUB_TOKEN", "GITHUB_API_URL", "GITHUB_TOOL_NO_CACHE")}
+    env.update({
+        "PATH": bin_dir + os.pathsep + os.environ.get("PATH", ""),
+        "GIT_CONFIG_GLOBAL": gitconfig,
+        "GITHUB_TOOL_TRANSPORT": "gh",
+        "BENCH_GH_DIR": root,
+        "BENCH_GH_REPOS": str(repo_count),
+        "BENCH_GH_LOGIN": LOGIN,
+    })
+    return env
+
+def fresh_home(root, env, name):
+    home = os.path.join(root, "homes", name)
+    shutil.rmtree(home, ignore_errors=True)
+    os.makedirs(os.path.join(home, "Github", "experimental"))
+    return {**env, "HOME": home, "XDG_CACHE_HOME": os.path.join(home, ".cache")}
+
+def time_call(function, repeat, setup=None, profile_path=None):
+    runs = []
+    for i in range(repeat):
+        argument = setup(i) if setup else None
+        profiler = cProfile.Profile() if profile_path and i == repeat - 1 else None
+        start = time.perf_counter()
+        if profiler:
+            profiler.runcall(function, argument)
+        else:
+            function(argument)
+        runs.append(time.perf_counter() - start)
+        if profiler:
+            profiler.dump_stats(profile_path)
+    return runs
+
+def run_tool(script, args, env, cwd=None):
+    result = subprocess.run([sys.executable, script, *args], env=env, cwd=cwd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"{os.path.basename(script)} {' '.join(args)} exited with {result.returncode}: {result.stderr.strip() or result.stdout.strip()[-500:]}")
+
+def make_remotes(root, names):
+    # Bare remotes for the batch benchmarks, copied from one small seed
+    # repository; the publish benchmark wipes the remotes directory, so they
+    # are recreated when missing
+    seed = os.path.join(root, "seed.git")
+    if not os.path.isdir(seed):
+        source = make_repo(os.path.join(root, "seed"), commits=50, branches=2, files=20)
+        subprocess.run(["git", "clone", "-q", "--bare", source, seed], check=True)
+    for name in names:
+        remote = os.path.join(root, "remotes", f"{name}.git")
+        if not os.path.isdir(remote):
+            shutil.copytree(seed, remote)
+    return seed
+
+def metric_benchmarks(repo, root):
+    # In-process timings of each metric group in github_metrics.py
+    now = int(time.time())
+    cutoff = github_metrics.commit_windows(now)["3 months"]
+    cache_path = os.path.join(root, "metrics.sqlite")
+
+    def cold_cache(i):
+        if os.path.exists(cache_path):
+            os.remove(cache_path)
+
+    def primed(function):
+        # Untimed first call so the warm benchmarks never measure a cold cache
+        def setup(i):
+            if i == 0:
+                function(None)
+        return setup
+
+    warm_commits = lambda _: github_metrics.cached_commit_stats(repo, cache_path, now)
+    warm_tree = lambda _: github_metrics.scan_tree(repo, cache_path)
+    warm_analyze = lambda _: github_metrics.analyze_repo(repo, cache_path=cache_path)
+    return [
+        ("commit_stats", lambda _: github_metrics.collect_commit_stats(repo, now), None),
+        ("commit_stats_cached_cold", lambda _: github_metrics.cached_commit_stats(repo, cache_path, now), cold_cache),
+        ("commit_stats_cached_warm", warm_commits, primed(warm_commits)),
+        ("branch_stats", lambda _: github_metrics.collect_branch_stats(repo, now, cutoff), None),
+        ("tree_scan", lambda _: github_metrics.scan_tree(repo), None),
+        ("tree_scan_cached_warm", warm_tree, primed(warm_tree)),
+        ("analyze_repo", lambda _: github_metrics.analyze_repo(repo), None),
+        ("analyze_repo_cached_warm", warm_analyze, primed(warm_analyze)),
+    ]
+
+def tool_benchmarks(root, env, fleet_dir, options, api_url):
+    # End-to-end timings of github_metrics.py and github_tool.py command paths,
+    # each run as its own process against the fake gh. The API cases run
+    # again with the HTTP transport against the stub at api_url.
+    repo_names = [f"repo-{i}" for i in range(options.api_items)]
+    batch_names = [f"repo-{i}" for i in range(options.batch_repos)]
+    http_env = {**env, "GITHUB_TOOL_TRANSPORT": "http", "GITHUB_API_URL": api_url, "GH_TOKEN": "benchmark-token"}
+
+    def cold(name, args, base=env):
+        return lambda i: (args, fresh_home(root, base, name))
+
+    def warm(name, args, base=env):
+        def setup(i):
+            if i == 0:
+                home_env = fresh_home(root, base, name)
+                run_tool(TOOL_PATH, args, home_env)
+                warm.envs[name] = home_env
+            return args, warm.envs[name]
+        return setup
+    warm.envs = {}
+
+    def publish(i):
+        home_env = fresh_home(root, env, f"publish-{i}")
+        experimental = os.path.join(home_env["HOME"], "Github", "experimental")
+        for n in range(options.publish_folders):
+            folder = os.path.join(experimental, f"bench-{i}-{n}")
+            os.makedirs(folder)
+            with open(os.path.join(folder, "README.md"), "w") as f:
+                f.write(f"# bench {n}\n")
+        shutil.rmtree(os.path.join(root, "remotes"))
+        os.makedirs(os.path.join(root, "remotes"))
+        return ["--publish-all", experimental, "--jobs", str(options.jobs)], home_env
+
+    def metrics(args):
+        return lambda i: (args, fresh_home(root, env, "metrics"))
+
+    def backup(name, fresh):
+        # fresh: every run mirrors from scratch; otherwise an untimed first
+        # run fills the backup and the timed ones find every mirror current
+        def setup(i):
+            make_remotes(root, batch_names)
+            home_env = fresh_home(root, env, name)
+            backup_dir = os.path.join(root, "backups", name)
+            args = ["--backup", *batch_names, backup_dir, "--jobs", str(options.jobs)]
+            if fresh:
+                shutil.rmtree(backup_dir, ignore_errors=True)
+            elif i == 0:
+                run_tool(TOOL_PATH, args, home_env)
+            return args, home_env
+        return setup
+
+    def update_noop(i):
+        # Clean clones with an upstream: what --update costs when nothing
+        # changed, i.e. one git status per repository
+        fleet = os.path.join(root, "update-fleet")
+        if i == 0:
+            seed = make_remotes(root, [])
+            shutil.rmtree(fleet, ignore_errors=True)
+            for n in range(options.update_repos):
+                subprocess.run(["git", "clone", "-q", seed, os.path.join(fleet, f"clone-{n}")], check=True)
+        return ["--update", fleet, "--jobs", str(options.jobs)], fresh_home(root, env, "update")
+
+    def secrets(name, base=env):
+        def setup(i):
+            manifest = os.path.join(root, "secrets.json")
+            with open(manifest, "w") as f:
+                json.dump({f"{LOGIN}/{repo}": {"API_KEY": "key", "DEPLOY_TOKEN": "token", "WEBHOOK_SECRET": "secret"} for repo in batch_names}, f)
+            return ["--add-secrets", manifest, "--jobs", str(options.jobs)], fresh_home(root, base, name)
+        return setup
+
+    def api_cases(suffix, base):
+        # The cases whose cost is mostly API calls, named <case><suffix>
+        return [
+            (f"list_repos{suffix}", "tool", cold(f"list{suffix}", ["--list"], base)),
+            (f"list_repos_etag_cache{suffix}", "tool", warm(f"list-warm{suffix}", ["--list"], base)),
+            (f"list_repos_limit{suffix}", "tool", cold(f"list-limit{suffix}", ["--list", "--limit", "10"], base)),
+            (f"list_gists{suffix}", "tool", cold(f"gists{suffix}", ["--list-gists"], base)),
+            (f"list_prs{suffix}", "tool", cold(f"prs{suffix}", ["--list-prs", "repo-0", "--state", "all"], base)),
+            (f"list_issues{suffix}", "tool", cold(f"issues{suffix}", ["--list-issues", "repo-0"], base)),
+            (f"list_notifications{suffix}", "tool", cold(f"notifications{suffix}", ["--list-notifications"], base)),
+            (f"repo_stats{suffix}", "tool", cold(f"stats{suffix}", ["--repo-stats", *repo_names], base)),
+            (f"add_secrets{suffix}", "tool", secrets(f"secrets{suffix}", base)),
+        ]
+
+    cases = [
+        ("metrics_cli", "metrics", metrics([fleet_dir, "--no-cache", "--jobs", str(options.jobs)])),
+        ("metrics_cli_json", "metrics", metrics([fleet_dir, "--no-cache", "--format", "json", "--jobs", str(options.jobs)])),
+        *api_cases("", env),
+        *api_cases("_http", http_env),
+        ("publish_all", "tool", publish),
+        ("backup", "tool", backup("backup", fresh=True)),
+        ("backup_unchanged", "tool", backup("backup-unchanged", fresh=False)),
+        ("update_noop", "tool", update_noop),
+    ]
+    benchmarks = []
+    for name, kind, setup in cases:
+        script = METRICS_PATH if kind == "metrics" else TOOL_PATH
+        benchmarks.append((name, lambda prepared, script=script: run_tool(script, prepared[0], prepared[1]), setup))
+    return benchmarks
+
+def summarize(group, name, runs):
+    return {
+        "group": group,
+        "name": name,
+        "runs": [round(run, 6) for run in runs],
+        "median": round(statistics.median(runs), 6),
+        "min": round(min(runs), 6),
+        "max": round(max(runs), 6),
+    }
+
+def git_version():
+    try:
+        return subprocess.run(["git", "--version"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+def run_benchmarks(options):
+    root = tempfile.mkdtemp(prefix="github-benchmark-")
+    results = []
+    api_stub = start_api_stub(options.api_items)
+    try:
+        env = make_environment(root, options.api_items)
+        fleet_dir = os.path.join(root, "fleet")
+        repos = [make_repo(os.path.join(fleet_dir, f"repo-{i}"), options.commits, options.branches, options.files, options.authors, seed=i) for i in range(options.repos)]
+
+        selected = [("metrics", benchmark) for benchmark in metric_benchmarks(repos[0], root)]
+        selected += [("tool", benchmark) for benchmark in tool_benchmarks(root, env, fleet_dir, options, api_stub.base_url)]
+
+        # The metric groups run git in-process, so they see the same
+        # environment as the subprocess benchmarks
+        saved_environ = dict(os.environ)
+        os.environ.update(fresh_home(root, env, "in-process"))
+        try:
+            for group, (name, function, setup) in selected:
+                if options.only and not any(pattern in name for pattern in options.only):
+                    continue
+                profile_path = None
+                if options.profile and group == "metrics":
+                    os.makedirs(options.profile, exist_ok=True)
+                    profile_path = os.path.join(options.profile, f"{name}.prof")
+                try:
+                    runs = time_call(function, options.repeat, setup, profile_path)
+                except (RuntimeError, OSError, subprocess.SubprocessError) as e:
+                    print(f"{group}/{name}: FAILED: {e}", file=sys.stderr)
+                    results.append({"group": group, "name": name, "error": str(e)})
+                    continue
+                result = summarize(group, name, runs)
+                results.append(result)
+                print(f"{group + '/' + name:36} median {result['median'] * 1000:9.1f} ms  min {result['min'] * 1000:9.1f} ms", flush=True)
+        finally:
+            os.environ.clear()
+            os.environ.update(saved_environ)
+    finally:
+        api_stub.shutdown()
+        api_stub.server_close()
+        if options.keep:
+            print(f"Benchmark files kept in {root}", file=sys.stderr)
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+    return {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "git": git_version(),
+        "config": {key: getattr(options, key) for key in ("repos", "commits", "branches", "files", "authors", "api_items", "batch_repos", "update_repos", "publish_folders", "repeat", "jobs")},
+        "results": results,
+    }
+
+def compare_results(baseline, current, threshold):
+    # Prints the change in median per benchmark; returns the names that got
+    # slower than the threshold allows
+    old = {(result["group"], result["name"]): result for result in baseline["results"] if "median" in result}
+    regressions = []
+    print(f"\nComparison against baseline from {baseline.get('created_at', 'unknown')}:")
+    for result in current["results"]:
+        key = (result["group"], result["name"])
+        if "median" not in result or key not in old:
+            continue
+        change = (result["median"] - old[key]["median"]) / old[key]["median"] if old[key]["median"] else 0.0
+        flag = ""
+        if change > threshold:
+            regressions.append(f"{key[0]}/{key[1]}")
+            flag = "  REGRESSION"
+        print(f"{key[0] + '/' + key[1]:36} {old[key]['median'] * 1000:9.1f} ms -> {result['median'] * 1000:9.1f} ms ({change:+.1%}){flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark github_metrics.py and github_tool.py against synthetic repositories and a fake gh")
+    parser.add_argument("--output", "-o", default="benchmark-results.json", metavar="FILE", help="Where to write the JSON results (default: benchmark-results.json)")
+    parser.add_argument("--compare", metavar="FILE", help="Earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, metavar="FRACTION", help="Slowdown of the median that counts as a regression with --compare (default: 0.10)")
+    parser.add_argument("--repos", type=int, default=4, metavar="N", help="Synthetic repositories in the fleet (default: 4)")
+    parser.add_argument("--commits", type=int, default=500, metavar="N", help="Commits per repository (default: 500)")
+    parser.add_argument("--branches", type=int, default=10, metavar="N", help="Topic branches per repository (default: 10)")
+    parser.add_argument("--files", type=int, default=200, metavar="N", help="Files per repository (default: 200)")
+    parser.add_argument("--authors", type=int, default=5, metavar="N", help="Distinct authors per repository (default: 5)")
+    parser.add_argument("--api-items", type=int, default=250, metavar="N", help="Items returned by each fake gh listing (default: 250)")
+    parser.add_argument("--batch-repos", type=int, default=20, metavar="N", help="Repositories used by the backup and add-secrets benchmarks (default: 20)")
+    parser.add_argument("--update-repos", type=int, default=100, metavar="N", help="Clean clones checked by the update_noop benchmark (default: 100)")
+    parser.add_argument("--publish-folders", type=int, default=8, metavar="N", help="Folders created for the publish benchmark (default: 8)")
+    parser.add_argument("--repeat", type=int, default=3, metavar="N", help="Timed runs per benchmark (default: 3)")
+    parser.add_argument("--jobs", "-j", type=int, default=4, metavar="N", help="Value passed to --jobs of the tools (default: 4)")
+    parser.add_argument("--only", nargs="+", metavar="NAME", help="Only run benchmarks whose name contains one of these strings")
+    parser.add_argument("--profile", metavar="DIR", help="Write cProfile stats of the last run of each metric group to DIR")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated repositories and fake gh for inspection")
+    args = parser.parse_args()
+
+    current = run_benchmarks(args)
+    with open(args.output, "w") as f:
+        json.dump(current, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare_results(baseline, current, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+    if any("error" in result for result in current["results"]):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
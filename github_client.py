@@ -0,0 +1,103 @@
+import json
+import os
+import shlex
+import socket
+import sys
+import threading
+
+# Thin client for `github_tool.py --serve`. It sends github_tool command lines
+# to the warm server over its Unix socket and replays what they printed, so
+# each call skips interpreter start-up, imports and the gh session check.
+# Only the standard library is imported to keep the client itself cheap.
+SOCKET_ENV = "GITHUB_TOOL_SOCKET"
+
+USAGE = """usage: github_client.py [--socket PATH] GITHUB_TOOL_ARGS...
+       github_client.py [--socket PATH] --batch [FILE]
+       github_client.py [--socket PATH] --ping | --shutdown
+
+--batch reads one github_tool command line per line from FILE (default: stdin)
+and pipelines all of them over a single connection. The socket defaults to
+$GITHUB_TOOL_SOCKET or the path `github_tool.py --serve` uses."""
+
+def default_socket_path():
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return os.path.join(runtime_dir, "github_automate_tool.sock")
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(cache_home, "github_automate_tool", "server.sock")
+
+def send_requests(socket_path, requests):
+    # Yields one response per request, in order. A writer thread streams the
+    # requests while responses are read, so a large batch cannot fill both
+    # socket buffers and deadlock.
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        with sock.makefile("rb") as reader, sock.makefile("wb") as writer:
+            def write_requests():
+                try:
+                    for request_id, request in enumerate(requests):
+                        writer.write(json.dumps({"id": request_id, **request}).encode() + b"\n")
+                    writer.flush()
+                    sock.shutdown(socket.SHUT_WR)
+                except OSError:
+                    pass
+
+            thread = threading.Thread(target=write_requests, daemon=True)
+            thread.start()
+            for _ in requests:
+                line = reader.readline()
+                if not line:
+                    raise ConnectionError("server closed the connection")
+                yield json.loads(line)
+            thread.join()
+
+def ping(socket_path):
+    try:
+        return next(send_requests(socket_path, [{"op": "ping"}]))["status"] == 0
+    except (OSError, ValueError, StopIteration):
+        return False
+
+def read_batch(path):
+    with (open(path) if path and path != "-" else sys.stdin) as f:
+        lines = [line.strip() for line in f]
+    return [shlex.split(line) for line in lines if line and not line.startswith("#")]
+
+def main():
+    argv = sys.argv[1:]
+    socket_path = os.environ.get(SOCKET_ENV) or default_socket_path()
+    if argv[:1] == ["--socket"] and len(argv) > 1:
+        socket_path, argv = argv[1], argv[2:]
+    if argv[:1] == ["--"]:
+        argv = argv[1:]
+    elif argv[:1] in (["-h"], ["--help"]):
+        argv = []
+    if not argv:
+        print(USAGE)
+        return
+
+    if argv[0] == "--ping":
+        requests = [{"op": "ping"}]
+    elif argv[0] == "--shutdown":
+        requests = [{"op": "shutdown"}]
+    elif argv[0] == "--batch":
+        requests = [{"argv": command, "cwd": os.getcwd()} for command in read_batch(argv[1] if len(argv) > 1 else None)]
+    else:
+        requests = [{"argv": argv, "cwd": os.getcwd()}]
+
+    status = 0
+    try:
+        for response in send_requests(socket_path, requests):
+            sys.stdout.write(response.get("stdout", ""))
+            sys.stderr.write(response.get("stderr", ""))
+            sys.stdout.flush()
+            status = max(status, response["status"])
+    except (OSError, ValueError) as e:
+        print(f"Could not reach the github_tool server on {socket_path}: {e}", file=sys.stderr)
+        print("Start one with: python github_tool.py --serve", file=sys.stderr)
+        sys.exit(1)
+    if argv[0] == "--ping":
+        print("ok")
+    sys.exit(status)
+
+if __name__ == "__main__":
+    main()
@@ -1,146 +1,975 @@
+import argparse
+import bisect
+import csv
+import functools
+import hashlib
+import json
 import os
+import posixpath
+import re
+import shutil
+import sqlite3
 import subprocess
-from datetime import datetime
+import threading
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from collections import Counter
+from datetime import date
 import shlex
+import sys
+from dataclasses import asdict, dataclass
+from typing import Optional
 
-def run_command(command, shell=False):
+import github_api
+import github_trace
+
+# One record per commit: a \x1e marker line with NUL separated fields, then
+# the --numstat lines for that commit.
+LOG_FORMAT = "%x1e%H%x00%P%x00%ct%x00%ad%x00%aN%x00%s"
+
+def run_command(command, shell=False, cwd=None, input=None):
+    with github_trace.command(command, cwd) as call:
+        try:
+            if shell:
+                result = subprocess.run(command, shell=True, cwd=cwd, input=input, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+            else:
+                args = shlex.split(command)
+                result = subprocess.run(args, cwd=cwd, input=input, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+            call.finish(result)
+            return result.stdout.strip()
+        except subprocess.CalledProcessError as e:
+            call.finish(e)
+            return "N/A"
+
+def stream_command(args, cwd=None, input=None):
+    stdin = subprocess.PIPE if input is not None else subprocess.DEVNULL
+    with github_trace.command(args, cwd) as call:
+        with subprocess.Popen(args, cwd=cwd, stdin=stdin, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, encoding="utf-8", errors="replace") as process:
+            if input is not None:
+                # git reads all of stdin before it starts writing output
+                process.stdin.write(input)
+                process.stdin.close()
+            for line in process.stdout:
+                call.stdout_bytes += len(line)
+                yield line.rstrip("\n")
+        call.status = process.returncode
+
+def months_ago(now, months):
+    # Same calendar arithmetic as git's approxidate for "N months ago"
+    tm = time.localtime(now)
+    return int(time.mktime((tm.tm_year, tm.tm_mon - months, tm.tm_mday, tm.tm_hour, tm.tm_min, tm.tm_sec, 0, 0, -1)))
+
+def commit_windows(now=None):
+    now = int(now if now is not None else time.time())
+    return {
+        "day": now - 86400,
+        "week": now - 7 * 86400,
+        "month": months_ago(now, 1),
+        "3 months": months_ago(now, 3),
+        "year": months_ago(now, 12),
+    }
+
+# Calendar granularities of the activity histograms; every bucket is a union of
+# local days, identified by the ordinal of its first day
+GRANULARITIES = ("day", "week", "month", "quarter", "year")
+
+def bucket_start(day, granularity):
+    if granularity == "day":
+        return day
+    start = date.fromordinal(day)
+    if granularity == "week":
+        return day - start.weekday()
+    if granularity == "month":
+        return start.replace(day=1).toordinal()
+    if granularity == "quarter":
+        return start.replace(month=start.month - (start.month - 1) % 3, day=1).toordinal()
+    return start.replace(month=1, day=1).toordinal()
+
+def next_bucket(start, granularity):
+    if granularity == "day":
+        return start + 1
+    if granularity == "week":
+        return start + 7
+    first = date.fromordinal(start)
+    months = {"month": 1, "quarter": 3, "year": 12}[granularity]
+    month = first.month - 1 + months
+    return first.replace(year=first.year + month // 12, month=month % 12 + 1).toordinal()
+
+class BucketCounter:
+    # Dense per-bucket totals of `width` series, stored interleaved in two
+    # growable arrays around the first bucket seen so a newest-first walk
+    # only ever appends
+    def __init__(self, width=1):
+        self.width = width
+        self.anchor = None
+        self.older = array("Q")
+        self.newer = array("Q")
+
+    def add(self, key, *values):
+        if self.anchor is None:
+            self.anchor = key
+        offset = self.anchor - key
+        counts, index = (self.older, offset) if offset >= 0 else (self.newer, -offset - 1)
+        index *= self.width
+        if index >= len(counts):
+            counts.frombytes(bytes(counts.itemsize * (index + self.width - len(counts))))
+        for series, value in enumerate(values):
+            counts[index + series] += value
+
+    def items(self):
+        # Non-empty (key, totals) pairs, oldest first
+        width = self.width
+        for bucket in range(len(self.older) // width - 1, -1, -1):
+            totals = self.older[bucket * width:(bucket + 1) * width]
+            if any(totals):
+                yield self.anchor - bucket, totals.tolist()
+        for bucket in range(len(self.newer) // width):
+            totals = self.newer[bucket * width:(bucket + 1) * width]
+            if any(totals):
+                yield self.anchor + bucket + 1, totals.tolist()
+
+    def merge(self, other):
+        for key, totals in other.items():
+            self.add(key, *totals)
+
+class SparseCounter:
+    # Per-bucket totals of `width` series for the keys actually seen, in
+    # walk order. Used per author, whose active days are far apart: a repeat
+    # of the last key adds to it in place, anything else is appended.
+    def __init__(self, width=1):
+        self.width = width
+        self.keys = array("l")
+        self.counts = array("Q")
+
+    def add(self, key, *values):
+        if self.keys and self.keys[-1] == key:
+            index = len(self.counts) - self.width
+            for series, value in enumerate(values):
+                self.counts[index + series] += value
+        else:
+            self.keys.append(key)
+            self.counts.extend(values)
+
+    def items(self):
+        # (key, totals) pairs, oldest first; a key the walk came back to
+        # after another one is summed here
+        totals = {}
+        width = self.width
+        for index, key in enumerate(self.keys):
+            entry = totals.setdefault(key, [0] * width)
+            for series in range(width):
+                entry[series] += self.counts[index * width + series]
+        return sorted(totals.items())
+
+    def merge(self, other):
+        for key, totals in other.items():
+            self.add(key, *totals)
+
+class ActivityHistogram:
+    # Commits and lines added/removed per local day, for the whole repository
+    # (dense) and per author (sparse), filled while walking the history.
+    # Weeks, months and longer buckets are unions of days and are re-bucketed
+    # from these.
+    SERIES = ("commits", "additions", "deletions")
+
+    def __init__(self):
+        self.total = BucketCounter(len(self.SERIES))
+        self.authors = {}
+        self.day = (0, 0, None)
+
+    def day_number(self, commit_time):
+        # Consecutive commits mostly fall on the same day, so the bounds of
+        # the last day seen are kept instead of converting every timestamp
+        start, end, day = self.day
+        if not start <= commit_time < end:
+            current = date.fromtimestamp(commit_time)
+            start = int(time.mktime(current.timetuple()))
+            end = int(time.mktime((current.year, current.month, current.day + 1, 0, 0, 0, 0, 0, -1)))
+            day = current.toordinal()
+            self.day = (start, end, day)
+        return day
+
+    def add(self, commit_time, author, additions, deletions):
+        day = self.day_number(commit_time)
+        self.total.add(day, 1, additions, deletions)
+        counter = self.authors.get(author)
+        if counter is None:
+            counter = self.authors[author] = SparseCounter(len(self.SERIES))
+        counter.add(day, 1, additions, deletions)
+
+    def merge(self, other):
+        self.total.merge(other.total)
+        for author, counter in other.authors.items():
+            if author not in self.authors:
+                self.authors[author] = SparseCounter(len(self.SERIES))
+            self.authors[author].merge(counter)
+
+    def series(self, counter, granularity):
+        # One entry per bucket from the first active bucket to the last,
+        # including empty ones, so the result plots as a time series
+        buckets = {}
+        for day, totals in counter.items():
+            bucket = buckets.setdefault(bucket_start(day, granularity), [0] * len(self.SERIES))
+            for index, total in enumerate(totals):
+                bucket[index] += total
+        if not buckets:
+            return []
+        result = []
+        start, last = min(buckets), max(buckets)
+        while start <= last:
+            totals = buckets.get(start, [0] * len(self.SERIES))
+            result.append({"start": date.fromordinal(start).isoformat(), **dict(zip(self.SERIES, totals))})
+            start = next_bucket(start, granularity)
+        return result
+
+    def report(self, granularity):
+        return {
+            "repo": self.series(self.total, granularity),
+            "authors": {author: self.series(counter, granularity) for author, counter in sorted(self.authors.items())},
+        }
+
+    def to_dict(self):
+        return {"total": list(self.total.items()), "authors": {author: list(counter.items()) for author, counter in self.authors.items()}}
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls()
+        for key, totals in data["total"]:
+            histogram.total.add(key, *totals)
+        for author, items in data["authors"].items():
+            counter = histogram.authors[author] = SparseCounter(len(cls.SERIES))
+            for key, totals in items:
+                counter.add(key, *totals)
+        return histogram
+
+def format_awk_number(value):
+    if value == int(value):
+        return str(int(value))
+    return "%.6g" % value
+
+class CommitStats:
+    # Accumulates every commit metric from a single `git log` walk.
+    # Commits reachable from HEAD are tracked with a frontier of pending
+    # parents, which works because --date-order never shows a parent before
+    # its children. Time-window metrics are derived from the timestamps of
+    # HEAD commits inside the longest window, so cached stats stay correct
+    # as time moves on; they are counted in buckets bounded by the window
+    # edges. Calendar histograms are filled in the same walk when asked for.
+    def __init__(self, head, windows, count_all=True, histogram=False):
+        self.windows = windows
+        self.count_all = count_all
+        self.pending = {head} if head else set()
+        self.total = 0
+        self.authors = Counter()
+        self.head_total = 0
+        self.weekdays = Counter()
+        self.recent = []
+        self.subject_total = 0
+        self.subject_max = None
+        self.subject_min = None
+        self.fix_commits = 0
+        self.empty_commits = 0
+        self.merge_commits = 0
+        self.sized_commits = 0
+        self.size_total = 0
+        self.histogram = ActivityHistogram() if histogram else None
+        self.buckets = None
+
+    def add(self, sha, parents, commit_time, weekday, author, subject, numstat):
+        if self.count_all:
+            self.total += 1
+            self.authors[author] += 1
+        if sha not in self.pending:
+            return
+        self.pending.discard(sha)
+        self.pending.update(parents)
+
+        self.head_total += 1
+        if commit_time >= min(self.windows.values()):
+            self.recent.append((commit_time, author))
+            self.buckets = None
+        self.weekdays[weekday] += 1
+
+        length = len(subject)
+        self.subject_total += length
+        if self.subject_max is None or length > self.subject_max:
+            self.subject_max = length
+        # Empty subjects are reported on their own, not as the shortest message
+        if length and (self.subject_min is None or length < self.subject_min):
+            self.subject_min = length
+        if "fix" in subject.lower():
+            self.fix_commits += 1
+        if not subject:
+            self.empty_commits += 1
+        if len(parents) > 1:
+            self.merge_commits += 1
+
+        insertions = deletions = 0
+        if numstat:
+            # The --stat summary used to be summed as files changed plus
+            # insertions (or deletions when there were no insertions)
+            for added, removed in numstat:
+                insertions += added
+                deletions += removed
+            self.sized_commits += 1
+            self.size_total += len(numstat) + (insertions or deletions)
+        if self.histogram is not None:
+            self.histogram.add(commit_time, author, insertions, deletions)
+
+    def merge(self, other):
+        self.total += other.total
+        self.authors.update(other.authors)
+        self.head_total += other.head_total
+        self.weekdays.update(other.weekdays)
+        self.recent.extend(other.recent)
+        self.subject_total += other.subject_total
+        self.subject_max = max((n for n in (self.subject_max, other.subject_max) if n is not None), default=None)
+        self.subject_min = min((n for n in (self.subject_min, other.subject_min) if n is not None), default=None)
+        self.fix_commits += other.fix_commits
+        self.empty_commits += other.empty_commits
+        self.merge_commits += other.merge_commits
+        self.sized_commits += other.sized_commits
+        self.size_total += other.size_total
+        if self.histogram is not None and other.histogram is not None:
+            self.histogram.merge(other.histogram)
+        self.buckets = None
+
+    def prune(self):
+        oldest = min(self.windows.values())
+        self.recent = [entry for entry in self.recent if entry[0] >= oldest]
+        self.buckets = None
+
+    def window_buckets(self):
+        # Recent commits counted between consecutive window edges, oldest
+        # edge first; a window is its own bucket plus every newer one
+        if self.buckets is None:
+            edges = sorted(self.windows.values())
+            counts = array("Q", bytes(8 * len(edges)))
+            authors = [set() for _ in edges]
+            for commit_time, author in self.recent:
+                index = bisect.bisect_right(edges, commit_time) - 1
+                if index >= 0:
+                    counts[index] += 1
+                    authors[index].add(author)
+            self.buckets = (edges, counts, authors)
+        return self.buckets
+
+    def window_count(self, name):
+        edges, counts, _ = self.window_buckets()
+        return sum(counts[edges.index(self.windows[name]):])
+
+    def recent_authors(self, name="3 months"):
+        edges, _, authors = self.window_buckets()
+        return set().union(*authors[edges.index(self.windows[name]):])
+
+    def to_dict(self):
+        return {
+            "total": self.total,
+            "authors": dict(self.authors),
+            "head_total": self.head_total,
+            "weekdays": dict(self.weekdays),
+            "subject_total": self.subject_total,
+            "subject_max": self.subject_max,
+            "subject_min": self.subject_min,
+            "fix_commits": self.fix_commits,
+            "empty_commits": self.empty_commits,
+            "merge_commits": self.merge_commits,
+            "sized_commits": self.sized_commits,
+            "size_total": self.size_total,
+            "histogram": self.histogram.to_dict() if self.histogram is not None else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data, windows, recent):
+        stats = cls(None, windows)
+        for key, value in data.items():
+            if key == "histogram":
+                value = ActivityHistogram.from_dict(value) if value is not None else None
+            elif key in ("authors", "weekdays"):
+                value = Counter(value)
+            setattr(stats, key, value)
+        stats.recent = list(recent)
+        stats.prune()
+        return stats
+
+    def author_counts(self):
+        # `git shortlog -sn` order: most commits first, then by name
+        by_name = sorted(self.authors.items())
+        return sorted(by_name, key=lambda item: item[1], reverse=True)
+
+    def most_active_contributor(self):
+        if not self.authors:
+            return None
+        return max(self.authors.items(), key=lambda item: (item[1], f"{item[1]:6d}\t{item[0]}"))
+
+    def weekday_counts(self):
+        # `uniq -c | sort -nr` order
+        return [(day, count) for count, day in sorted(((count, day) for day, count in self.weekdays.items()), reverse=True)]
+
+    def average_subject_length(self):
+        if not self.head_total:
+            return None
+        return self.subject_total / self.head_total
+
+    def average_commit_size(self):
+        if not self.sized_commits:
+            return None
+        return self.size_total / self.sized_commits
+
+def parse_numstat(line):
+    added, removed, _ = line.split("\t", 2)
+    # Binary files show "-" and count as a changed file with no lines
+    return (int(added) if added != "-" else 0, int(removed) if removed != "-" else 0)
+
+def walk_commits(stats, repo_path, revisions, exclude=(), numstat=True):
+    command = ["git", "log", "--date-order", "--date=format:%A", f"--format={LOG_FORMAT}"] + list(revisions)
+    if numstat:
+        command.append("--numstat")
+    # Excluded commits go through stdin so thousands of refs never hit ARG_MAX
+    if exclude:
+        command.append("--stdin")
+
+    commit = None
+    changes = []
+    stdin = "".join(f"^{sha}\n" for sha in exclude) if exclude else None
+    for line in stream_command(command, cwd=repo_path, input=stdin):
+        if line.startswith("\x1e"):
+            if commit:
+                stats.add(*commit, changes)
+            sha, parents, commit_time, weekday, author, subject = line[1:].split("\x00", 5)
+            commit = (sha, parents.split(), int(commit_time), weekday, author, subject)
+            changes = []
+        elif line and commit:
+            changes.append(parse_numstat(line))
+    if commit:
+        stats.add(*commit, changes)
+    return stats
+
+def get_head(repo_path):
+    head = run_command("git rev-parse --verify -q HEAD", cwd=repo_path)
+    return head if head != "N/A" else None
+
+def collect_commit_stats(repo_path, now=None, head=None, histogram=False):
+    head = head or get_head(repo_path)
+    return walk_commits(CommitStats(head, commit_windows(now), histogram=histogram), repo_path, ["--all"])
+
+# Incremental cache of commit metrics, keyed by repository path and the state
+# of its refs.
+def default_cache_path():
+    return os.path.join(github_api.get_cache_dir(), "metrics.sqlite")
+
+def open_cache(cache_path):
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    conn = sqlite3.connect(cache_path, timeout=60)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE IF NOT EXISTS repos (path TEXT PRIMARY KEY, ref_hash TEXT, head TEXT, tips TEXT, stats TEXT)")
+    conn.execute("CREATE TABLE IF NOT EXISTS recent_commits (path TEXT, commit_time INTEGER, author TEXT)")
+    conn.execute("CREATE INDEX IF NOT EXISTS recent_commits_path ON recent_commits (path, commit_time)")
+    conn.execute("CREATE TABLE IF NOT EXISTS blob_lines (sha TEXT PRIMARY KEY, lines INTEGER)")
+    return conn
+
+def get_ref_state(repo_path):
+    head = get_head(repo_path)
+    refs = run_command("git for-each-ref '--format=%(objectname) %(refname)'", cwd=repo_path)
+    refs = "" if refs == "N/A" else refs
+    tips = sorted({line.split(" ", 1)[0] for line in refs.splitlines()} | ({head} if head else set()))
+    ref_hash = hashlib.sha1(f"{head}\n{refs}".encode()).hexdigest()
+    return head, tips, ref_hash
+
+def load_cached_stats(conn, repo_path, windows):
+    row = conn.execute("SELECT ref_hash, head, tips, stats FROM repos WHERE path = ?", (repo_path,)).fetchone()
+    if row is None:
+        return None
+    ref_hash, head, tips, data = row
+    data = json.loads(data)
+    if not data.get("histogram"):
+        # Written before activity histograms existed; rebuild from scratch
+        return None
+    recent = conn.execute("SELECT commit_time, author FROM recent_commits WHERE path = ? AND commit_time >= ?", (repo_path, min(windows.values()))).fetchall()
+    return ref_hash, head, json.loads(tips), CommitStats.from_dict(data, windows, recent)
+
+def store_cached_stats(conn, repo_path, ref_hash, head, tips, stats):
+    stats.prune()
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO repos VALUES (?, ?, ?, ?, ?)", (repo_path, ref_hash, head, json.dumps(tips), json.dumps(stats.to_dict())))
+        conn.execute("DELETE FROM recent_commits WHERE path = ?", (repo_path,))
+        conn.executemany("INSERT INTO recent_commits VALUES (?, ?, ?)", [(repo_path, commit_time, author) for commit_time, author in stats.recent])
+
+def can_extend(repo_path, old_head, old_tips, head):
+    # Deltas only add commits: HEAD must have moved forward and no previously
+    # counted commit may have become unreachable
+    if old_head is None or head is None:
+        return False
+    if old_head != head and run_command(f"git merge-base --is-ancestor {old_head} {head}", cwd=repo_path) == "N/A":
+        return False
+    unreachable = run_command("git rev-list --count --stdin --not --all", cwd=repo_path, input="".join(f"{sha}\n" for sha in old_tips))
+    return unreachable == "0"
+
+def cached_commit_stats(repo_path, cache_path, now=None):
+    repo_path = os.path.abspath(repo_path)
+    windows = commit_windows(now)
+    head, tips, ref_hash = get_ref_state(repo_path)
+    conn = open_cache(cache_path)
+    try:
+        cached = load_cached_stats(conn, repo_path, windows)
+        if cached and cached[0] == ref_hash:
+            return cached[3]
+
+        if cached and can_extend(repo_path, cached[1], cached[2], head):
+            _, old_head, old_tips, stats = cached
+            # New commits anywhere in the repository only feed the --all
+            # metrics; old_head..head feeds the HEAD metrics, including
+            # already known commits that were merged into HEAD
+            stats.merge(walk_commits(CommitStats(None, windows), repo_path, ["--all"], exclude=old_tips, numstat=False))
+            if head != old_head:
+                stats.merge(walk_commits(CommitStats(head, windows, count_all=False, histogram=True), repo_path, [head], exclude=[old_head]))
+        else:
+            # Cached stats always carry the histogram, so a later --histogram
+            # run can use them
+            stats = collect_commit_stats(repo_path, now, head, histogram=True)
+
+        store_cached_stats(conn, repo_path, ref_hash, head, tips, stats)
+        return stats
+    finally:
+        conn.close()
+
+class BranchStats:
+    # Branch, tag and merge metrics from one `git for-each-ref` listing
+    def __init__(self, now, cutoff):
+        self.now = now
+        self.cutoff = cutoff
+        self.branches = 0
+        self.tags = 0
+        self.local = []
+        self.merged = set()
+
+    def add(self, refname, name, committed, created):
+        if refname.startswith("refs/tags/"):
+            self.tags += 1
+            return
+        # `git branch -a` lists local and remote-tracking branches
+        self.branches += 1
+        if refname.startswith("refs/heads/"):
+            self.local.append((name, int(committed or 0), int(created or 0)))
+
+    @property
+    def active(self):
+        return sum(1 for _, committed, _ in self.local if committed >= self.cutoff)
+
+    @property
+    def stale(self):
+        return len(self.local) - self.active
+
+    def longest_active(self):
+        if not self.local:
+            return None
+        name, days = max(((name, (self.now - committed) // 86400) for name, committed, _ in self.local), key=lambda item: (item[1], f"{item[0]}|{item[1]}"))
+        return {"name": name, "days": days}
+
+    def average_lifespan(self):
+        if not self.local:
+            return None
+        return sum((committed - created) / 86400 for _, committed, created in self.local) / len(self.local)
+
+def collect_branch_stats(repo_path, now, cutoff):
+    stats = BranchStats(now, cutoff)
+    output = run_command("git for-each-ref --format=%(refname)%00%(refname:short)%00%(committerdate:unix)%00%(creatordate:unix) refs/heads/ refs/remotes/ refs/tags/", cwd=repo_path)
+    if output != "N/A":
+        for line in output.splitlines():
+            stats.add(*line.split("\x00"))
+    # Every branch whose tip is reachable from HEAD, in a single call
+    merged = run_command("git for-each-ref --merged HEAD --format=%(refname:short) refs/heads/", cwd=repo_path)
+    if merged != "N/A":
+        stats.merged = set(merged.splitlines())
+    return stats
+
+class TreeStats:
+    # File, directory, size and line totals for every blob in the HEAD tree
+    def __init__(self):
+        self.files = 0
+        self.directories = set()
+        self.lines = 0
+        self.bytes = 0
+        self.largest = None
+        self.smallest = None
+
+    def add(self, path, size, lines):
+        self.files += 1
+        self.directories.add(posixpath.dirname(path) or ".")
+        if size is None:
+            return
+        self.lines += lines
+        self.bytes += size
+        if self.largest is None or size > self.largest[0]:
+            self.largest = (size, path)
+        if self.smallest is None or size < self.smallest[0]:
+            self.smallest = (size, path)
+
+    @staticmethod
+    def describe(entry):
+        if entry is None:
+            return None
+        size, path = entry
+        return {"path": path, "bytes": size}
+
+def list_tree(repo_path):
+    # Yields (path, sha, size) for every entry of HEAD; submodules have no size
+    args = ["git", "ls-tree", "-r", "-l", "-z", "HEAD"]
+    with github_trace.command(args, repo_path) as call:
+        result = subprocess.run(args, cwd=repo_path, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        call.finish(result)
+    if result.returncode != 0:
+        return
+    for record in result.stdout.split(b"\0"):
+        if not record:
+            continue
+        info, path = record.split(b"\t", 1)
+        _, object_type, sha, size = info.split()
+        yield path.decode("utf-8", "replace"), sha.decode(), int(size) if object_type == b"blob" else None
+
+def feed_lines(stream, lines):
+    try:
+        for line in lines:
+            stream.write(line.encode() + b"\n")
+    finally:
+        stream.close()
+
+def count_blob_lines(repo_path, shas):
+    # Streams every blob through one `git cat-file --batch` process and counts
+    # newlines chunk by chunk, so large files are never held in memory
+    counts = {}
+    if not shas:
+        return counts
+    args = ["git", "cat-file", "--batch"]
+    with github_trace.command(args, repo_path) as call, subprocess.Popen(args, cwd=repo_path, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL) as process:
+        # Feed stdin from a thread so a full stdout pipe cannot deadlock us
+        feeder = threading.Thread(target=feed_lines, args=(process.stdin, shas))
+        feeder.start()
+        for sha in shas:
+            header = process.stdout.readline().split()
+            if len(header) != 3:
+                continue
+            remaining = int(header[2])
+            call.stdout_bytes += remaining
+            lines = 0
+            while remaining:
+                chunk = process.stdout.read(min(remaining, 1 << 20))
+                if not chunk:
+                    break
+                lines += chunk.count(b"\n")
+                remaining -= len(chunk)
+            process.stdout.read(1)
+            counts[sha] = lines
+        feeder.join()
+        call.status = process.wait()
+    return counts
+
+def load_blob_lines(conn, shas):
+    counts = {}
+    shas = list(shas)
+    for start in range(0, len(shas), 500):
+        chunk = shas[start:start + 500]
+        placeholders = ",".join("?" * len(chunk))
+        counts.update(conn.execute(f"SELECT sha, lines FROM blob_lines WHERE sha IN ({placeholders})", chunk).fetchall())
+    return counts
+
+def store_blob_lines(conn, counts):
+    with conn:
+        conn.executemany("INSERT OR REPLACE INTO blob_lines VALUES (?, ?)", counts.items())
+
+def scan_tree(repo_path, cache_path=None):
+    entries = list(list_tree(repo_path))
+    shas = {sha for _, sha, size in entries if size}
+
+    conn = open_cache(cache_path) if cache_path else None
     try:
-        if shell:
-            result = subprocess.run(command, shell=True, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        line_counts = load_blob_lines(conn, shas) if conn else {}
+        missing = sorted(shas - line_counts.keys())
+        counted = count_blob_lines(repo_path, missing)
+        line_counts.update(counted)
+        if conn and counted:
+            store_blob_lines(conn, counted)
+    finally:
+        if conn:
+            conn.close()
+
+    tree = TreeStats()
+    for path, sha, size in entries:
+        tree.add(path, size, line_counts.get(sha, 0))
+    return tree
+
+def parse_count(text):
+    text = text.strip()
+    return int(text) if text.isdigit() else None
+
+def format_count(value):
+    return "N/A" if value is None else value
+
+def format_average(value):
+    return "" if value is None else format_awk_number(value)
+
+def format_branch(entry):
+    return "" if entry is None else f"{entry['name']}|{entry['days']}"
+
+def format_file(entry):
+    return "" if entry is None else f"{entry['path']} ({entry['bytes']} bytes)"
+
+@dataclass
+class RepoMetrics:
+    repo: str
+    commits: int
+    branches: int
+    tags: int
+    files: int
+    directories: int
+    lines_of_code: int
+    bytes_of_code: int
+    active_branches: int
+    longest_active_branch: Optional[dict]
+    largest_file: Optional[dict]
+    smallest_file: Optional[dict]
+    largest_directory: str
+    ignored_files: Optional[int]
+    commits_last_day: int
+    commits_last_week: int
+    commits_last_month: int
+    commits_last_year: int
+    commits_by_author: dict
+    commits_by_weekday: dict
+    average_commit_message_length: Optional[float]
+    longest_commit_message: Optional[int]
+    shortest_commit_message: Optional[int]
+    average_commit_size: Optional[float]
+    fix_commits: int
+    empty_message_commits: int
+    merge_commits: int
+    merged_branches: int
+    stale_branches: int
+    average_branch_lifespan_days: Optional[float]
+    github_cli: bool
+    open_pull_requests: Optional[int]
+    closed_pull_requests: Optional[int]
+    open_issues: Optional[int]
+    closed_issues: Optional[int]
+    contributors: int
+    most_active_contributor: Optional[dict]
+    contributors_last_3_months: int
+    activity: Optional[dict] = None
+
+    def to_record(self):
+        record = asdict(self)
+        # Histograms are only part of the record when they were requested
+        if record["activity"] is None:
+            del record["activity"]
+        return record
+
+    def to_csv_row(self):
+        return {key: json.dumps(value) if isinstance(value, dict) else value for key, value in self.to_record().items()}
+
+    def to_text(self):
+        authors = "\n".join(f"{count:6d}\t{name}" for name, count in self.commits_by_author.items()).strip()
+        weekdays = "\n".join(f"{count:7d} {day}" for day, count in self.commits_by_weekday.items()).strip()
+        most_active = ""
+        if self.most_active_contributor:
+            most_active = f"{self.most_active_contributor['commits']}\t{self.most_active_contributor['name']}"
+
+        report = [
+            f"Analyzing repository: {self.repo}",
+            f"Number of commits: {self.commits}",
+            f"Number of branches: {self.branches}",
+            f"Number of tags: {self.tags}",
+            f"Number of files: {self.files}",
+            f"Number of directories: {self.directories}",
+            f"Number of lines of code: {self.lines_of_code}",
+            f"Number of bytes of code: {self.bytes_of_code}",
+            f"Number of active branches (updated in last 3 months): {self.active_branches}",
+            f"Longest active branch (days): {format_branch(self.longest_active_branch)}",
+            f"Largest file (by size): {format_file(self.largest_file)}",
+            f"Smallest file (by size): {format_file(self.smallest_file)}",
+            f"Largest directory (by size): {self.largest_directory}",
+            f"Number of ignored files: {format_count(self.ignored_files)}",
+            f"Number of commits in last day: {self.commits_last_day}",
+            f"Number of commits in last week: {self.commits_last_week}",
+            f"Number of commits in last month: {self.commits_last_month}",
+            f"Number of commits in last year: {self.commits_last_year}",
+            "Number of commits by author:",
+            authors,
+            "Number of commits by day of week:",
+            weekdays,
+            f"Average commit message length: {format_average(self.average_commit_message_length)}",
+            f"Longest commit message: {'' if self.longest_commit_message is None else self.longest_commit_message}",
+            f"Shortest commit message: {'' if self.shortest_commit_message is None else self.shortest_commit_message}",
+            f"Average commit size (lines changed): {format_average(self.average_commit_size)}",
+            f"Number of commits with 'fix' in message: {self.fix_commits}",
+            f"Number of commits with empty message: {self.empty_message_commits}",
+            f"Number of merge commits: {self.merge_commits}",
+            f"Number of merged branches: {self.merged_branches}",
+            f"Number of stale branches (no activity in 3 months): {self.stale_branches}",
+            f"Average lifespan of a branch before merging (days): {format_average(self.average_branch_lifespan_days)}",
+        ]
+        if self.github_cli:
+            report += [
+                f"Number of open pull requests: {format_count(self.open_pull_requests)}",
+                f"Number of closed pull requests: {format_count(self.closed_pull_requests)}",
+                f"Number of open issues: {format_count(self.open_issues)}",
+                f"Number of closed issues: {format_count(self.closed_issues)}",
+            ]
+        else:
+            report.append("GitHub CLI not found. Skipping pull request and issue metrics.")
+        report += [
+            f"Number of contributors: {self.contributors}",
+            f"Most active contributor: {most_active}",
+            f"Number of contributors in last 3 months: {self.contributors_last_3_months}",
+        ]
+        for granularity, activity in (self.activity or {}).items():
+            report.append(f"Commit activity by {granularity} (commits, lines added, lines removed):")
+            report += [f"{bucket['start']}\t{bucket['commits']:6d}\t+{bucket['additions']}\t-{bucket['deletions']}" for bucket in activity["repo"]]
+        report.append("------------------------")
+        return "\n".join(report)
+
+def get_github_remote(repo_path):
+    url = run_command("git remote get-url origin", cwd=repo_path)
+    match = re.match(r"(?:https://|ssh://)?(?:[^@/]+@)?github\.com[:/]([^/]+)/(.+?)(?:\.git)?/?$", url)
+    return f"{match.group(1)}/{match.group(2)}" if match else None
+
+def github_available():
+    return shutil.which("gh") is not None or bool(github_api.get_token())
+
+def fetch_github_counts(repo_paths):
+    # Pull request and issue counts for every repository with a GitHub origin,
+    # fetched in a handful of batched GraphQL requests
+    remotes = {repo_path: get_github_remote(repo_path) for repo_path in repo_paths}
+    stats = github_api.fetch_repo_stats(remote for remote in remotes.values() if remote)
+    return {repo_path: stats.get(remote) for repo_path, remote in remotes.items() if remote}
+
+def analyze_repo(repo_path, github_counts=None, cache_path=None, histograms=()):
+    # Every metric group runs in its own trace span so --trace can attribute
+    # each command to the metric that needed it
+    with github_trace.span(os.path.basename(repo_path)):
+        return collect_repo_metrics(repo_path, github_counts, cache_path, histograms)
+
+def collect_repo_metrics(repo_path, github_counts, cache_path, histograms):
+    with github_trace.span("commit_stats"):
+        if cache_path:
+            commits = cached_commit_stats(repo_path, cache_path)
         else:
-            args = shlex.split(command)
-            result = subprocess.run(args, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
-        return result.stdout.strip()
-    except subprocess.CalledProcessError:
-        return "N/A"
-
-def analyze_repo(repo_path):
-    os.chdir(repo_path)
-    print(f"Analyzing repository: {repo_path}")
-
-    # General Project Metrics
-    print(f"Number of commits: {run_command('git rev-list --all --count')}")
-    print(f"Number of branches: {run_command('git branch -a | wc -l', shell=True)}")
-    print(f"Number of tags: {run_command('git tag | wc -l', shell=True)}")
-    print(f"Number of files: {run_command('git ls-files | wc -l', shell=True)}")
-    print(f"Number of directories: {run_command('git ls-files | xargs -n1 dirname | sort -u | wc -l', shell=True)}")
-    
-    lines_of_code = run_command("git ls-files | xargs wc -l | tail -n 1 | awk '{print $1}'", shell=True)
-    print(f"Number of lines of code: {lines_of_code}")
-    
-    print(f"Number of bytes of code: {run_command('git ls-files | xargs cat | wc -c', shell=True)}")
-
-    # Active branches
-    active_branches = run_command("""
-    git for-each-ref --sort=-committerdate refs/heads/ --format='%(refname:short)' | 
-    while read branch; do 
-        if [ "$(git log -1 --since='3 months ago' -s $branch)" ]; then 
-            echo $branch; 
-        fi; 
-    done | wc -l
-    """, shell=True)
-    print(f"Number of active branches (updated in last 3 months): {active_branches}")
-
-    # Longest active branch
-    current_timestamp = int(datetime.now().timestamp())
-    longest_branch = run_command(f"""
-    git for-each-ref --sort=-committerdate --format='%(refname:short)|%(committerdate:unix)' refs/heads/ | 
-    while IFS='|' read branch date; do 
-        echo "$branch|$(( ({current_timestamp} - $date) / 86400 ))"; 
-    done | sort -t'|' -k2 -nr | head -n1
-    """, shell=True)
-    print(f"Longest active branch (days): {longest_branch}")
-
-    # File sizes
-    largest_file = run_command("""
-    git ls-files | xargs -I{} git ls-files -s {} | 
-    sort -k2 -nr | head -n1 | awk '{print $4 " (" $2 " bytes)"}'
-    """, shell=True)
-    smallest_file = run_command("""
-    git ls-files | xargs -I{} git ls-files -s {} | 
-    sort -k2 -n | head -n1 | awk '{print $4 " (" $2 " bytes)"}'
-    """, shell=True)
-    print(f"Largest file (by size): {largest_file}")
-    print(f"Smallest file (by size): {smallest_file}")
-
-    print(f"Largest directory (by size): {run_command('du -sh * | sort -rh | head -n1', shell=True)}")
-    
-    ignored_files = run_command("git status --ignored --porcelain | grep '^!!' | wc -l", shell=True)
-    print(f"Number of ignored files: {ignored_files}")
-
-    # Commit Metrics
-    print(f"Number of commits in last day: {run_command('git rev-list --count --since=1.day HEAD')}")
-    print(f"Number of commits in last week: {run_command('git rev-list --count --since=1.week HEAD')}")
-    print(f"Number of commits in last month: {run_command('git rev-list --count --since=1.month HEAD')}")
-    print(f"Number of commits in last year: {run_command('git rev-list --count --since=1.year HEAD')}")
-
-    print("Number of commits by author:")
-    print(run_command('git shortlog -sn --all'))
-
-    print("Number of commits by day of week:")
-    print(run_command('git log --format="%ad" --date=format:"%A" | sort | uniq -c | sort -nr', shell=True))
-
-    avg_commit_msg_length = run_command("git log --format=%s | awk '{ sum += length($0); n++ } END { if (n > 0) print sum / n; }'", shell=True)
-    print(f"Average commit message length: {avg_commit_msg_length}")
-
-    longest_commit_msg = run_command("git log --format=%s | awk '{ if (length($0) > max) max = length($0) } END { print max }'", shell=True)
-    print(f"Longest commit message: {longest_commit_msg}")
-
-    shortest_commit_msg = run_command("git log --format=%s | awk '{ if (min == 0 || length($0) < min) min = length($0) } END { print min }'", shell=True)
-    print(f"Shortest commit message: {shortest_commit_msg}")
-
-    avg_commit_size = run_command("git log --stat --oneline | awk '/^ [0-9]/ { s+=$1+$4; n++ } END { if (n > 0) print s/n }'", shell=True)
-    print(f"Average commit size (lines changed): {avg_commit_size}")
-
-    fix_commits = run_command("git log --oneline | grep -ci 'fix' || echo 0", shell=True)
-    print(f"Number of commits with 'fix' in message: {fix_commits}")
-
-    empty_commits = run_command("git log --format=%s | grep -c '^$' || echo 0", shell=True)
-    print(f"Number of commits with empty message: {empty_commits}")
-
-    merge_commits = run_command('git log --merges --oneline | wc -l', shell=True)
-    print(f"Number of merge commits: {merge_commits}")
-
-    # Branch Metrics
-    print(f"Number of merged branches: {run_command('git branch --merged | wc -l', shell=True)}")
-    
-    stale_branches = run_command("""
-    git for-each-ref --sort=-committerdate --format="%(refname:short)" refs/heads/ | 
-    while read branch; do 
-        if [ -z "$(git log -1 --since="3 months ago" -s $branch)" ]; then 
-            echo $branch; 
-        fi; 
-    done | wc -l
-    """, shell=True)
-    print(f"Number of stale branches (no activity in 3 months): {stale_branches}")
-    
-    avg_branch_lifespan = run_command("""
-    git for-each-ref --format='%(refname:short)|%(creatordate:unix)|%(committerdate:unix)' refs/heads/ | 
-    awk -F'|' '{ if ($3 != "") print ($3 - $2) / 86400 }' | 
-    awk '{ sum += $1; n++ } END { if (n > 0) print sum / n; }'
-    """, shell=True)
-    print(f"Average lifespan of a branch before merging (days): {avg_branch_lifespan}")
+            commits = collect_commit_stats(repo_path, histogram=bool(histograms))
+    with github_trace.span("tree_scan"):
+        tree = scan_tree(repo_path, cache_path)
+    with github_trace.span("branch_stats"):
+        branches = collect_branch_stats(repo_path, int(time.time()), commits.windows["3 months"])
+
+    with github_trace.span("ignored_files"):
+        ignored_files = run_command("git status --ignored --porcelain | grep '^!!' | wc -l", shell=True, cwd=repo_path)
+    with github_trace.span("largest_directory"):
+        largest_directory = run_command('du -sh * | sort -rh | head -n1', shell=True, cwd=repo_path)
 
     # Pull Request and Issue Metrics (if using GitHub CLI)
-    if subprocess.call(['which', 'gh'], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) == 0:
-        print(f"Number of open pull requests: {run_command('gh pr list --state open --limit 1000 | wc -l', shell=True)}")
-        print(f"Number of closed pull requests: {run_command('gh pr list --state closed --limit 1000 | wc -l', shell=True)}")
-        print(f"Number of open issues: {run_command('gh issue list --state open --limit 1000 | wc -l', shell=True)}")
-        print(f"Number of closed issues: {run_command('gh issue list --state closed --limit 1000 | wc -l', shell=True)}")
+    with github_trace.span("github_counts"):
+        github_cli = github_available()
+        if github_cli and github_counts is None:
+            github_counts = fetch_github_counts([repo_path]).get(repo_path)
+        github_counts = github_counts or {}
+
+    most_active = commits.most_active_contributor()
+    return RepoMetrics(
+        repo=repo_path,
+        commits=commits.total,
+        branches=branches.branches,
+        tags=branches.tags,
+        files=tree.files,
+        directories=len(tree.directories),
+        lines_of_code=tree.lines,
+        bytes_of_code=tree.bytes,
+        active_branches=branches.active,
+        longest_active_branch=branches.longest_active(),
+        largest_file=TreeStats.describe(tree.largest),
+        smallest_file=TreeStats.describe(tree.smallest),
+        largest_directory=largest_directory,
+        ignored_files=parse_count(ignored_files),
+        commits_last_day=commits.window_count('day'),
+        commits_last_week=commits.window_count('week'),
+        commits_last_month=commits.window_count('month'),
+        commits_last_year=commits.window_count('year'),
+        commits_by_author=dict(commits.author_counts()),
+        commits_by_weekday=dict(commits.weekday_counts()),
+        average_commit_message_length=commits.average_subject_length(),
+        longest_commit_message=commits.subject_max,
+        shortest_commit_message=commits.subject_min,
+        average_commit_size=commits.average_commit_size(),
+        fix_commits=commits.fix_commits,
+        empty_message_commits=commits.empty_commits,
+        merge_commits=commits.merge_commits,
+        merged_branches=len(branches.merged),
+        stale_branches=branches.stale,
+        average_branch_lifespan_days=branches.average_lifespan(),
+        github_cli=github_cli,
+        open_pull_requests=github_counts.get("open_pull_requests"),
+        closed_pull_requests=github_counts.get("closed_pull_requests"),
+        open_issues=github_counts.get("open_issues"),
+        closed_issues=github_counts.get("closed_issues"),
+        contributors=len(commits.authors),
+        most_active_contributor={"name": most_active[0], "commits": most_active[1]} if most_active else None,
+        contributors_last_3_months=len(commits.recent_authors()),
+        activity={granularity: commits.histogram.report(granularity) for granularity in histograms} or None,
+    )
+
+def find_repos(repo_dir):
+    repos = []
+    for dir_name in sorted(os.listdir(repo_dir)):
+        full_path = os.path.join(repo_dir, dir_name)
+        if os.path.isdir(full_path) and os.path.exists(os.path.join(full_path, ".git")):
+            repos.append(full_path)
+    return repos
+
+def write_results(results, output_format, out=sys.stdout):
+    # Every format except json writes each repository as soon as it is ready
+    if output_format == "json":
+        json.dump([metrics.to_record() for metrics in results], out, indent=2)
+        out.write("\n")
+        return
+
+    writer = None
+    for metrics in results:
+        if output_format == "ndjson":
+            out.write(json.dumps(metrics.to_record()) + "\n")
+        elif output_format == "csv":
+            row = metrics.to_csv_row()
+            if writer is None:
+                writer = csv.DictWriter(out, fieldnames=list(row))
+                writer.writeheader()
+            writer.writerow(row)
+        else:
+            out.write(metrics.to_text() + "\n")
+        out.flush()
+
+def main():
+    parser = argparse.ArgumentParser(description="Report git and GitHub metrics for every repository in a directory")
+    parser.add_argument("repo_dir", nargs="?", default=os.path.expanduser("~/Github/active"), help="Directory containing the repositories (default: ~/Github/active)")
+    parser.add_argument("--jobs", "-j", type=int, default=1, metavar="N", help="Number of repositories to analyze in parallel (default: 1)")
+    parser.add_argument("--cache", default=default_cache_path(), metavar="FILE", help="SQLite file used to cache commit metrics between runs")
+    parser.add_argument("--no-cache", action="store_true", help="Recompute every metric from scratch without reading or writing the cache")
+    parser.add_argument("--format", choices=["text", "json", "ndjson", "csv"], default="text", help="Output format (default: text)")
+    parser.add_argument("--histogram", nargs="+", choices=GRANULARITIES, default=[], metavar="GRANULARITY", help=f"Add commit and churn time series per repository and per author, bucketed by {', '.join(GRANULARITIES)} (text output shows the repository series only)")
+    parser.add_argument("--trace", nargs="?", const="1", metavar="FILE", help="Time every command: print the slowest ones to stderr, or write Chrome trace JSON to FILE (also GITHUB_TOOL_TRACE)")
+    args = parser.parse_args()
+    github_trace.start(args.trace)
+
+    repos = find_repos(args.repo_dir)
+    with github_trace.span("github_counts"):
+        github_counts = fetch_github_counts(repos) if github_available() else {}
+    # A repository whose batched lookup failed maps to None; {} keeps
+    # analyze_repo from fetching it again one repository at a time
+    counts = [github_counts.get(repo_path) or {} for repo_path in repos]
+    analyze = functools.partial(analyze_repo, cache_path=None if args.no_cache else args.cache, histograms=tuple(dict.fromkeys(args.histogram)))
+    if args.jobs > 1:
+        # map() yields in submission order, so results come out in a stable
+        # order as soon as every earlier repository has finished
+        with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+            write_results(executor.map(analyze, repos, counts), args.format)
     else:
-        print("GitHub CLI not found. Skipping pull request and issue metrics.")
-
-    # Contributor Metrics
-    print(f"Number of contributors: {run_command('git shortlog -sn --all | wc -l', shell=True)}")
-    print(f"Most active contributor: {run_command('git shortlog -sn --all | sort -rn | head -n1', shell=True)}")
-    contributors_3_months = run_command('git shortlog -sn --since="3 months ago" | wc -l', shell=True)
-    print(f"Number of contributors in last 3 months: {contributors_3_months}")
-
-    print("------------------------")
-
-# Main execution
-repo_dir = os.path.expanduser("~/Github/active")
-for dir_name in os.listdir(repo_dir):
-    full_path = os.path.join(repo_dir, dir_name)
-    if os.path.isdir(full_path) and os.path.exists(os.path.join(full_path, ".git")):
-        analyze_repo(full_path)
\ No newline at end of file
+        write_results(map(analyze, repos, counts), args.format)
+
+if __name__ == "__main__":
+    main()
@@ -4,64 +4,247 @@ import sys
 import argparse
 import json
 import shutil
+import time
+import hashlib
+import http.client
+import contextlib
+import io
+import itertools
+import signal
+import socket
+import tempfile
+import threading
+import traceback
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import github_api
+import github_client
+import github_trace
+
+# Local index of the authenticated user's repository names. It is refreshed
+# from GitHub once it is older than REPO_INDEX_TTL seconds and patched in place
+# whenever this tool creates, renames or deletes a repository.
+REPO_INDEX_TTL = 3600
+_repo_index = None
+_repo_index_lock = threading.RLock()
+
+# gh installation, authentication and login are resolved once per process and
+# kept on disk for SESSION_TTL seconds, so scripted loops skip the round trip.
+SESSION_TTL = 300
+_session = None
+_session_lock = threading.Lock()
+
+# Options that modify a command rather than select one
+GLOBAL_OPTIONS = ("trace", "transport", "no-cache", "limit", "state", "jobs", "network-jobs", "verify-clone", "message", "fsmonitor")
 
 def run_command(command, cwd=None, check=True):
+    with github_trace.command(command, cwd) as call:
+        try:
+            result = subprocess.run(command, text=True, capture_output=True, cwd=cwd, check=check)
+            call.finish(result)
+            return result.stdout.strip()
+        except subprocess.CalledProcessError as e:
+            call.finish(e)
+            print(f"Error executing command: {' '.join(command)}")
+            print(f"Error message: {e.stderr.strip()}")
+            return None
+
+def get_cache_dir():
+    return github_api.get_cache_dir()
+
+def get_session_path():
+    return os.path.join(get_cache_dir(), "session.json")
+
+def get_auth_fingerprint():
+    # Changes whenever `gh auth login/logout` rewrites hosts.yml or a token is
+    # supplied through the environment, which invalidates the cached session
+    config_dir = os.environ.get("GH_CONFIG_DIR") or os.path.join(os.environ.get("XDG_CONFIG_HOME") or os.path.expanduser("~/.config"), "gh")
+    try:
+        hosts_mtime = os.stat(os.path.join(config_dir, "hosts.yml")).st_mtime_ns
+    except OSError:
+        hosts_mtime = None
+    token = os.environ.get("GH_TOKEN") or os.environ.get("GITHUB_TOKEN") or ""
+    return f"{hosts_mtime}:{hashlib.sha256(token.encode()).hexdigest()[:16]}"
+
+def resolve_session():
+    # One `gh api user` call answers all three questions: a missing binary
+    # fails to start, a missing login fails the request
+    command = ["gh", "api", "user", "-q", ".login"]
+    with github_trace.command(command) as call:
+        try:
+            result = subprocess.run(command, text=True, capture_output=True)
+        except FileNotFoundError:
+            return {"installed": False, "login": None}
+        call.finish(result)
+    login = result.stdout.strip() if result.returncode == 0 else ""
+    return {"installed": True, "login": login or None}
+
+def load_session_file(fingerprint):
     try:
-        result = subprocess.run(command, text=True, capture_output=True, cwd=cwd, check=check)
-        return result.stdout.strip()
-    except subprocess.CalledProcessError as e:
-        print(f"Error executing command: {' '.join(command)}")
-        print(f"Error message: {e.stderr.strip()}")
+        with open(get_session_path()) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if data.get("fingerprint") != fingerprint or time.time() - data.get("checked_at", 0) >= SESSION_TTL:
         return None
+    return data.get("session")
+
+def write_json_file(path, data):
+    # Each writer gets its own temporary file, so concurrent saves never
+    # rename each other's half-written data
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+
+def save_session_file(fingerprint, session):
+    write_json_file(get_session_path(), {"fingerprint": fingerprint, "checked_at": time.time(), "session": session})
+
+def get_session(refresh=False):
+    # The in-memory copy expires like the file does, so a long-running
+    # --serve process notices `gh auth login/logout`. The lock lets the worker
+    # threads of the batch modes share one refresh.
+    global _session
+    fingerprint = get_auth_fingerprint()
+    with _session_lock:
+        if _session is not None and _session[1] != fingerprint:
+            github_api.reset_auth()
+        if _session is not None and not refresh:
+            checked_at, session_fingerprint, session = _session
+            if session_fingerprint == fingerprint and time.time() - checked_at < SESSION_TTL:
+                return session
+
+        session = None if refresh else load_session_file(fingerprint)
+        if session is None:
+            session = resolve_session()
+            # Only a working login is worth remembering across processes
+            if session["login"]:
+                save_session_file(fingerprint, session)
+        _session = (time.time(), fingerprint, session)
+        return session
 
 # Utility Functions to check GitHub CLI installation and authentication
 def check_gh_installed():
-    if run_command(["gh", "--version"], check=False) is None:
+    if not get_session()["installed"]:
         print("GitHub CLI (gh) is not installed. Please install it first.")
         sys.exit(1)
 
 def check_gh_auth():
-    if run_command(["gh", "auth", "status"], check=False) is None:
+    if not get_session()["login"]:
         print("You are not authenticated with GitHub CLI. Please run 'gh auth login' first.")
         sys.exit(1)
 
-def get_default_branch():
-    return run_command(["git", "rev-parse", "--abbrev-ref", "HEAD"]) or "main"
+def get_default_branch(cwd=None):
+    return run_command(["git", "rev-parse", "--abbrev-ref", "HEAD"], cwd=cwd) or "main"
 
-def repo_exists_locally():
-    return os.path.isdir(".git")
+def repo_exists_locally(path="."):
+    return os.path.isdir(os.path.join(path, ".git"))
 
 def get_github_username():
-    return run_command(["gh", "api", "user", "-q", ".login"])
+    return get_session()["login"]
 
-def get_github_repos():
-    result = run_command(["gh", "repo", "list", "--json", "name", "--limit", "1000"])
-    if result:
+def get_repo_index_path():
+    # One index per account, so switching `gh auth` users never mixes them
+    return os.path.join(get_cache_dir(), f"repo_index-{get_github_username() or 'unknown'}.json")
+
+def iter_github_repos(visibility="all", limit=None):
+    # Follows every page, so accounts with more than a thousand repositories
+    # are listed completely
+    return github_api.iter_items("user/repos", {"affiliation": "owner", "visibility": visibility}, limit=limit)
+
+def fetch_github_repos():
+    try:
+        return [repo["name"] for repo in iter_github_repos()]
+    except (github_api.APIError, OSError, http.client.HTTPException) as e:
+        print(f"Error message: {e}")
+        return None
+
+def list_repos(visibility="all", limit=None):
+    try:
+        for repo in iter_github_repos(visibility, limit):
+            print(f"{repo['full_name']}\t{'private' if repo['private'] else 'public'}\t{repo['description'] or ''}", flush=True)
+    except (github_api.APIError, OSError, http.client.HTTPException) as e:
+        print(f"Error retrieving repositories: {e}")
+
+def load_repo_index_file():
+    try:
+        with open(get_repo_index_path()) as f:
+            data = json.load(f)
+        return data["fetched_at"], set(data["repos"])
+    except (OSError, ValueError, KeyError):
+        return None
+
+def save_repo_index():
+    write_json_file(get_repo_index_path(), {"fetched_at": _repo_index[0], "repos": sorted(_repo_index[1])})
+
+def get_repo_index(refresh=False):
+    global _repo_index
+    with _repo_index_lock:
+        if not refresh:
+            if _repo_index is None:
+                _repo_index = load_repo_index_file()
+            if _repo_index is not None and time.time() - _repo_index[0] < REPO_INDEX_TTL:
+                return _repo_index[1]
+
+        names = fetch_github_repos()
+        if names is None:
+            print("Error retrieving GitHub repository list.")
+            return _repo_index[1] if _repo_index else set()
+        _repo_index = (time.time(), set(names))
+        save_repo_index()
+        return _repo_index[1]
+
+def update_repo_index(added=None, removed=None):
+    # Only patch an index that is already loaded; a missing one is rebuilt on
+    # the next lookup anyway
+    with _repo_index_lock:
+        if _repo_index is None and load_repo_index_file() is None:
+            return
+        names = get_repo_index()
+        if removed:
+            names.discard(removed)
+        if added:
+            names.add(added)
+        save_repo_index()
+
+def invalidate_repo_index():
+    global _repo_index
+    with _repo_index_lock:
+        _repo_index = None
         try:
-            return [repo['name'] for repo in json.loads(result)]
-        except json.JSONDecodeError:
-            print("Error parsing GitHub repository list.")
-    return []
+            os.remove(get_repo_index_path())
+        except FileNotFoundError:
+            pass
+
+def get_github_repos():
+    return sorted(get_repo_index())
 
 def repo_exists_on_github(repo_name):
-    return repo_name in get_github_repos()
+    return repo_name in get_repo_index()
 
-def link_to_github(dir_name):
+def link_to_github(dir_name, cwd=None, log=print):
     username = get_github_username()
     if not username:
-        print("Failed to get GitHub username. Please check your GitHub CLI authentication.")
+        log("Failed to get GitHub username. Please check your GitHub CLI authentication.")
         return False
 
     repo_url = f"https://github.com/{username}/{dir_name}.git"
-    print(f"Attempting to link local repository to {repo_url}")
+    log(f"Attempting to link local repository to {repo_url}")
     
-    run_command(["git", "remote", "remove", "origin"], check=False)
-    result = run_command(["git", "remote", "add", "origin", repo_url])
+    run_command(["git", "remote", "remove", "origin"], cwd=cwd, check=False)
+    result = run_command(["git", "remote", "add", "origin", repo_url], cwd=cwd)
     if result is None:
-        print(f"Failed to add remote origin {repo_url}")
+        log(f"Failed to add remote origin {repo_url}")
         return False
 
-    print(f"Successfully added remote origin {repo_url}")
+    log(f"Successfully added remote origin {repo_url}")
     return True
 
 def get_full_path(folder_name):
@@ -69,186 +252,576 @@ def get_full_path(folder_name):
         return folder_name
     return os.path.join(os.path.expanduser("~"), "Github", "experimental", folder_name)
 
-def publish_repo(folder_path):
+def publish_folder(folder_path, log=print, network=None, verify_clone=False):
+    # Runs the whole publish pipeline for one folder without touching the
+    # process working directory. Network stages run inside `network`, which
+    # batch mode uses to cap concurrent pushes. Returns True on success.
+    network = network or contextlib.nullcontext()
     if not os.path.isdir(folder_path):
-        print(f"Error: Directory '{folder_path}' does not exist.")
-        sys.exit(1)
+        log(f"Error: Directory '{folder_path}' does not exist.")
+        return False
 
-    os.chdir(folder_path)
-    dir_name = os.path.basename(os.path.abspath(folder_path))
+    folder_path = os.path.abspath(folder_path)
+    dir_name = os.path.basename(folder_path)
 
-    if not repo_exists_locally():
-        run_command(["git", "init"])
-        print("Initialized new git repository.")
+    # Checked before anything is created or pushed, so a name clash does not
+    # leave a published repository stranded outside ~/Github/active
+    active_path = os.path.join(os.path.expanduser("~"), "Github", "active")
+    new_path = os.path.join(active_path, dir_name)
+    if os.path.exists(new_path):
+        log(f"Error: '{new_path}' already exists. Nothing was published for {folder_path}")
+        return False
+
+    if not repo_exists_locally(folder_path):
+        run_command(["git", "init"], cwd=folder_path)
+        log("Initialized new git repository.")
 
     if not repo_exists_on_github(dir_name):
-        result = run_command(["gh", "repo", "create", dir_name, "--public", "--source=."])
+        with network:
+            result = run_command(["gh", "repo", "create", dir_name, "--public", "--source=."], cwd=folder_path)
         if result is None:
-            print(f"Failed to create repository '{dir_name}' on GitHub.")
-            sys.exit(1)
-        print(f"Repository '{dir_name}' created on GitHub.")
+            log(f"Failed to create repository '{dir_name}' on GitHub.")
+            invalidate_repo_index()
+            return False
+        update_repo_index(added=dir_name)
+        log(f"Repository '{dir_name}' created on GitHub.")
     else:
-        print(f"Repository '{dir_name}' already exists on GitHub. Linking local repository.")
-        if not link_to_github(dir_name):
-            sys.exit(1)
+        log(f"Repository '{dir_name}' already exists on GitHub. Linking local repository.")
+        if not link_to_github(dir_name, cwd=folder_path, log=log):
+            return False
+
+    run_command(["git", "add", "."], cwd=folder_path)
+    run_command(["git", "commit", "-m", "Initial commit"], cwd=folder_path)
+    branch = get_default_branch(folder_path)
+    with network:
+        push_result = run_command(["git", "push", "-u", "origin", branch], cwd=folder_path)
+    if push_result is None:
+        log(f"Failed to push repository '{dir_name}' to GitHub.")
+        return False
+    log(f"Repository '{dir_name}' has been pushed to GitHub.")
 
-    run_command(["git", "add", "."])
-    run_command(["git", "commit", "-m", "Initial commit"])
-    run_command(["git", "push", "-u", "origin", get_default_branch()])
-    print(f"Repository '{dir_name}' has been pushed to GitHub.")
+    # Another folder of the same batch may have taken the name meanwhile
+    if os.path.exists(new_path):
+        log(f"Error: '{new_path}' already exists. The repository remains at {folder_path}")
+        return False
 
-    active_path = os.path.join(os.path.expanduser("~"), "Github", "active")
-    new_path = os.path.join(active_path, dir_name)
-    
     os.makedirs(active_path, exist_ok=True)
     shutil.move(folder_path, new_path)
-    print(f"Moved '{dir_name}' to {new_path}")
+    log(f"Moved '{dir_name}' to {new_path}")
 
-    os.chdir(active_path)
-    clone_result = run_command(["git", "clone", f"https://github.com/{get_github_username()}/{dir_name}.git"])
-    
-    if clone_result is not None:
-        print(f"Successfully cloned repository to {new_path}")
-        shutil.rmtree(new_path)
-        print(f"Removed original folder: {new_path}")
+    if verify_clone:
+        return replace_with_clone(dir_name, new_path, log, network)
+    return finalize_local(new_path, branch, log, network)
+
+def finalize_local(repo_path, branch, log=print, network=None):
+    # The pushed folder already is a working copy of the remote; make sure it
+    # tracks origin and that GitHub has the same commit instead of cloning
+    # everything back down.
+    network = network or contextlib.nullcontext()
+    run_command(["git", "branch", f"--set-upstream-to=origin/{branch}", branch], cwd=repo_path)
+    local_head = run_command(["git", "rev-parse", "HEAD"], cwd=repo_path)
+    with network:
+        remote = run_command(["git", "ls-remote", "origin", f"refs/heads/{branch}"], cwd=repo_path)
+    remote_head = remote.split()[0] if remote else None
+    if local_head and local_head == remote_head:
+        log(f"Verified {repo_path} matches origin/{branch} ({local_head[:12]})")
+        return True
+    log(f"Warning: {repo_path} is at {local_head} but origin/{branch} is at {remote_head}")
+    return False
+
+def replace_with_clone(dir_name, repo_path, log=print, network=None):
+    # Optional verify mode: download a fresh clone and swap it in for the
+    # pushed folder, proving the remote alone reproduces the repository
+    network = network or contextlib.nullcontext()
+    clone_path = f"{repo_path}.clone-tmp"
+    with network:
+        clone_result = run_command(["git", "clone", f"https://github.com/{get_github_username()}/{dir_name}.git", clone_path])
+    if clone_result is None:
+        shutil.rmtree(clone_path, ignore_errors=True)
+        log(f"Failed to clone repository. The original folder remains at {repo_path}")
+        return False
+
+    shutil.rmtree(repo_path)
+    os.rename(clone_path, repo_path)
+    log(f"Successfully cloned repository to {repo_path} and removed the original folder")
+    return True
+
+def publish_repo(folder_path, verify_clone=False):
+    if not publish_folder(folder_path, verify_clone=verify_clone):
+        sys.exit(1)
+
+def find_unpublished_folders(parent_dir):
+    return [os.path.join(parent_dir, name) for name in sorted(os.listdir(parent_dir)) if os.path.isdir(os.path.join(parent_dir, name))]
+
+class BatchLog:
+    # Shared by the batch modes: every worker's messages are prefixed with
+    # its folder name, and the last one is kept for the final summary
+    def __init__(self):
+        self.results = {}
+        self.last_messages = {}
+
+    def logger(self, path):
+        name = os.path.basename(os.path.abspath(path))
+        def log(message):
+            self.last_messages[path] = message
+            print(f"[{name}] {message}", flush=True)
+        return log
+
+    def collect(self, futures, failed_result):
+        # Waits for {future: path}; an exception counts as a failure and
+        # becomes the message shown for that path
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                self.results[path] = future.result()
+            except Exception as e:
+                self.results[path] = failed_result
+                self.last_messages[path] = f"{type(e).__name__}: {e}"
+
+    def print_summary(self, paths, failed_result, show_ok=True):
+        for path in paths:
+            if self.results[path] == failed_result:
+                print(f"  FAILED  {path}: {self.last_messages.get(path, 'unknown error')}")
+            elif show_ok:
+                print(f"  OK      {path}")
+
+def publish_many(folder_paths, jobs=None, network_jobs=8, verify_clone=False):
+    # Local git work runs on `jobs` worker threads (each stage is a
+    # subprocess), while gh/git network calls share a smaller limit.
+    if not folder_paths:
+        print("No folders to publish.")
+        return True
+
+    get_repo_index()
+    network = threading.BoundedSemaphore(network_jobs)
+    batch = BatchLog()
+
+    def publish(folder_path):
+        with github_trace.span(os.path.basename(os.path.abspath(folder_path))):
+            return publish_folder(folder_path, batch.logger(folder_path), network, verify_clone)
+
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as executor:
+        batch.collect({executor.submit(publish, path): path for path in folder_paths}, False)
+
+    succeeded = [path for path in folder_paths if batch.results[path]]
+    print(f"\nPublished {len(succeeded)} of {len(folder_paths)} folders.")
+    batch.print_summary(folder_paths, False)
+    return len(succeeded) == len(folder_paths)
+
+def find_git_repos(parent_dir):
+    return [os.path.join(parent_dir, name) for name in sorted(os.listdir(parent_dir)) if os.path.exists(os.path.join(parent_dir, name, ".git"))]
+
+def get_repo_status(repo_path, fsmonitor=False):
+    # One `git status` call answers everything --update needs: the branch,
+    # its upstream, commits not pushed yet and whether anything changed
+    command = ["git"]
+    if fsmonitor:
+        command += ["-c", "core.fsmonitor=true", "-c", "core.untrackedCache=true"]
+    command += ["status", "--porcelain=v2", "-z", "--branch"]
+    with github_trace.command(command, repo_path) as call:
+        result = subprocess.run(command, cwd=repo_path, capture_output=True)
+        call.finish(result)
+    if result.returncode != 0:
+        return {"error": result.stderr.decode("utf-8", "replace").strip()}
+
+    status = {"branch": None, "oid": None, "upstream": None, "ahead": 0, "unpublished": False, "changes": 0, "unmerged": 0}
+    records = iter(result.stdout.split(b"\0"))
+    for record in records:
+        if record.startswith(b"# branch.oid "):
+            oid = record[len(b"# branch.oid "):].decode()
+            status["oid"] = None if oid == "(initial)" else oid
+        elif record.startswith(b"# branch.head "):
+            branch = record[len(b"# branch.head "):].decode()
+            status["branch"] = None if branch == "(detached)" else branch
+        elif record.startswith(b"# branch.upstream "):
+            status["upstream"] = record[len(b"# branch.upstream "):].decode()
+        elif record.startswith(b"# branch.ab "):
+            status["ahead"] = int(record.split()[2])
+        elif record[:2] in (b"1 ", b"2 ", b"u ", b"? "):
+            status["changes"] += 1
+            if record.startswith(b"u "):
+                status["unmerged"] += 1
+            elif record.startswith(b"2 "):
+                # Renames are followed by the original path as its own field
+                next(records, None)
+
+    # Without an upstream git reports no ahead count. A branch with commits
+    # still needs a push when origin exists and does not have its tip yet.
+    if status["branch"] and status["oid"] and not status["upstream"]:
+        if run_command(["git", "config", "--get", "remote.origin.url"], cwd=repo_path, check=False):
+            remote_head = run_command(["git", "for-each-ref", "--format=%(objectname)", f"refs/remotes/origin/{status['branch']}"], cwd=repo_path, check=False)
+            status["unpublished"] = remote_head != status["oid"]
+    return status
+
+def update_working_copy(repo_path, status, message, log=print, network=None):
+    # Commits everything that changed and pushes the branch. Returns
+    # "pushed", "committed" (nothing to push to) or "failed".
+    network = network or contextlib.nullcontext()
+    if "error" in status:
+        log(f"Error reading status: {status['error']}")
+        return "failed"
+    if status["unmerged"]:
+        log("Unmerged paths, resolve them before updating.")
+        return "failed"
+
+    if status["changes"]:
+        if run_command(["git", "add", "-A"], cwd=repo_path) is None or run_command(["git", "commit", "-m", message], cwd=repo_path) is None:
+            log("Failed to commit changes.")
+            return "failed"
+        log(f"Committed {status['changes']} changed path(s).")
+
+    branch = status["branch"]
+    if not branch:
+        log("Detached HEAD, not pushing.")
+        return "committed"
+    if status["upstream"]:
+        push_command = ["git", "push"]
+    elif "origin" in (run_command(["git", "remote"], cwd=repo_path) or "").split():
+        push_command = ["git", "push", "-u", "origin", branch]
     else:
-        print(f"Failed to clone repository. The original folder remains at {new_path}")
+        log("No upstream or origin remote, not pushing.")
+        return "committed"
+
+    with network:
+        if run_command(push_command, cwd=repo_path) is None:
+            log(f"Failed to push {branch}.")
+            return "failed"
+    log(f"Pushed {branch}.")
+    return "pushed"
+
+def update_repo(path=".", message="Update repository", jobs=None, network_jobs=8, fsmonitor=False):
+    # PATH is either one working copy or a directory of them. Clean
+    # repositories cost a single `git status`; only dirty or unpushed ones
+    # go on to commit and push, while the remaining checks keep running.
+    path = os.path.abspath(path)
+    if not os.path.isdir(path):
+        print(f"Error: Directory '{path}' does not exist.")
+        return False
+    repo_paths = [path] if os.path.exists(os.path.join(path, ".git")) else find_git_repos(path)
+    if not repo_paths:
+        print(f"No git repositories found in '{path}'.")
+        return True
+
+    started = time.time()
+    network = threading.BoundedSemaphore(network_jobs)
+    batch = BatchLog()
+
+    def update(repo_path, status):
+        with github_trace.span(os.path.basename(repo_path)):
+            return update_working_copy(repo_path, status, message, batch.logger(repo_path), network)
+
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as executor:
+        checks = {executor.submit(get_repo_status, repo_path, fsmonitor): repo_path for repo_path in repo_paths}
+        updates = {}
+        for future in as_completed(checks):
+            repo_path = checks[future]
+            try:
+                status = future.result()
+            except Exception as e:
+                status = {"error": f"{type(e).__name__}: {e}"}
+            if "error" in status or status["changes"] or status["ahead"] or status["unpublished"]:
+                updates[executor.submit(update, repo_path, status)] = repo_path
+            else:
+                batch.results[repo_path] = "clean"
+        batch.collect(updates, "failed")
+
+    counts = Counter(batch.results.values())
+    print(f"\nChecked {len(repo_paths)} repositories in {time.time() - started:.1f}s: "
+          f"{counts['clean']} clean, {counts['pushed']} pushed, {counts['committed']} committed only, {counts['failed']} failed.")
+    batch.print_summary(repo_paths, "failed", show_ok=False)
+    return counts["failed"] == 0
+
+def get_backup_state_path(backup_dir):
+    return os.path.join(backup_dir, ".backup_state.json")
+
+def load_backup_state(backup_dir):
+    try:
+        with open(get_backup_state_path(backup_dir)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_backup_state(backup_dir, state):
+    path = get_backup_state_path(backup_dir)
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+def mirror_repo(full_name, backup_dir, known_refs=None):
+    # Returns (status, refs_hash) where status is "cloned", "updated",
+    # "unchanged" or "failed". One `git ls-remote` decides whether anything
+    # has to be fetched at all.
+    with github_trace.span(full_name):
+        return update_mirror(full_name, backup_dir, known_refs)
+
+def update_mirror(full_name, backup_dir, known_refs):
+    url = f"https://github.com/{full_name}.git"
+    mirror_path = os.path.join(backup_dir, f"{full_name}.git")
+    refs = run_command(["git", "ls-remote", url])
+    if refs is None:
+        return "failed", known_refs
+    refs_hash = hashlib.sha256(refs.encode()).hexdigest()
+
+    if os.path.isdir(mirror_path):
+        if refs_hash == known_refs:
+            return "unchanged", refs_hash
+        if run_command(["git", "remote", "update", "--prune"], cwd=mirror_path) is None:
+            return "failed", known_refs
+        return "updated", refs_hash
+
+    os.makedirs(os.path.dirname(mirror_path), exist_ok=True)
+    if run_command(["git", "clone", "--mirror", "--quiet", url, mirror_path]) is None:
+        shutil.rmtree(mirror_path, ignore_errors=True)
+        return "failed", known_refs
+    return "cloned", refs_hash
+
+def backup_repos(repo_names, backup_dir, jobs=8):
+    os.makedirs(backup_dir, exist_ok=True)
+    state = load_backup_state(backup_dir)
+    full_names = list(dict.fromkeys(get_repo_full_name(repo_name) for repo_name in repo_names))
+    counts = {"cloned": 0, "updated": 0, "unchanged": 0, "failed": 0}
+
+    with ThreadPoolExecutor(max_workers=jobs or 8) as executor:
+        futures = {executor.submit(mirror_repo, full_name, backup_dir, state.get(full_name, {}).get("refs")): full_name for full_name in full_names}
+        for future in as_completed(futures):
+            full_name = futures[future]
+            try:
+                status, refs_hash = future.result()
+            except Exception as e:
+                status, refs_hash = "failed", None
+                print(f"Error backing up '{full_name}': {e}")
+            counts[status] += 1
+            print(f"{status:9} {full_name}", flush=True)
+            if status != "failed":
+                state[full_name] = {"refs": refs_hash, "checked_at": time.time()}
+                # Saved after every repository so an interrupted run resumes
+                save_backup_state(backup_dir, state)
+
+    print(f"\nBacked up {len(full_names)} repositories to {backup_dir}: " + ", ".join(f"{count} {status}" for status, count in counts.items()))
+    return counts["failed"] == 0
+
+def backup_account(backup_dir, jobs=8):
+    try:
+        full_names = [repo["full_name"] for repo in iter_github_repos()]
+    except (github_api.APIError, OSError, http.client.HTTPException) as e:
+        print(f"Error retrieving repositories: {e}")
+        return False
+    return backup_repos(full_names, backup_dir, jobs)
+
+def get_repo_full_name(repo_name):
+    # Bare repository names belong to the authenticated user, as with gh
+    if "/" in repo_name:
+        return repo_name
+    return f"{get_github_username()}/{repo_name}"
+
+def read_gist_file(file_path):
+    with open(file_path) as f:
+        return {os.path.basename(file_path): {"content": f.read()}}
 
 def create_gist(file_path):
     if not os.path.exists(file_path):
         print(f"Error: File '{file_path}' does not exist.")
         sys.exit(1)
 
-    gist_url = run_command(["gh", "gist", "create", file_path])
-    if gist_url:
-        print(f"Gist created successfully. URL: {gist_url}")
+    response = github_api.call_api("POST", "gists", {"public": False, "files": read_gist_file(file_path)})
+    if response:
+        print(f"Gist created successfully. URL: {response.json()['html_url']}")
     else:
         print("There was an issue creating the Gist.")
 
-def list_gists():
-    result = run_command(["gh", "gist", "list", "--json", "id,description,public"])
-    if result:
-        gists = json.loads(result)
-        for gist in gists:
-            print(f"Gist ID: {gist['id']}, Description: {gist['description']}, Public: {gist['public']}")
-    else:
+def list_gists(limit=None):
+    try:
+        for gist in github_api.iter_items("gists", limit=limit):
+            print(f"Gist ID: {gist['id']}, Description: {gist['description']}, Public: {gist['public']}", flush=True)
+    except (github_api.APIError, OSError, http.client.HTTPException):
         print("Error retrieving Gists.")
 
 def edit_gist(gist_id, file_path):
-    result = run_command(["gh", "gist", "edit", gist_id, file_path])
-    if result is None:
+    if not os.path.exists(file_path):
+        print(f"Error: File '{file_path}' does not exist.")
+        sys.exit(1)
+
+    if github_api.call_api("PATCH", f"gists/{gist_id}", {"files": read_gist_file(file_path)}):
         print(f"Gist '{gist_id}' edited successfully.")
     else:
         print(f"Failed to edit Gist '{gist_id}'.")
 
 def delete_gist(gist_id):
-    result = run_command(["gh", "gist", "delete", gist_id])
-    if result is None:
+    if github_api.call_api("DELETE", f"gists/{gist_id}"):
         print(f"Gist '{gist_id}' deleted successfully.")
     else:
         print(f"Failed to delete Gist '{gist_id}'.")
 
 def list_notifications():
-    result = run_command(["gh", "api", "notifications"])
-    if result:
-        notifications = json.loads(result)
-        for notification in notifications:
+    response = github_api.call_api("GET", "notifications")
+    if response:
+        for notification in response.json():
             print(f"Notification: {notification['reason']}, Repository: {notification['repository']['full_name']}")
     else:
         print("Error retrieving notifications.")
 
 def mark_notifications_as_read():
-    result = run_command(["gh", "api", "-X", "PUT", "notifications"])
-    if result is None:
+    if github_api.call_api("PUT", "notifications", {}):
         print("Marked all notifications as read.")
     else:
         print("Failed to mark notifications as read.")
 
 def list_secrets(repo_name):
-    result = run_command(["gh", "secret", "list", "--repo", repo_name])
-    if result:
-        print(result)
+    response = github_api.call_api("GET", f"repos/{get_repo_full_name(repo_name)}/actions/secrets")
+    secrets = response.json()["secrets"] if response else []
+    if secrets:
+        for secret in secrets:
+            print(f"{secret['name']}\t{secret['updated_at']}")
     else:
         print(f"No secrets found for repository '{repo_name}'.")
 
+def set_secret(full_name, secret_name, secret_value, public_keys=None):
+    if github_api.can_seal_secrets():
+        return github_api.put_secret(full_name, secret_name, secret_value, public_keys)
+    # Without PyNaCl gh does the encryption; the value goes over stdin so it
+    # never shows up in the process list
+    command = ["gh", "secret", "set", secret_name, "--repo", full_name]
+    try:
+        with github_trace.command(command) as call:
+            call.finish(subprocess.run(command, input=secret_value, check=True, capture_output=True, text=True))
+        return True
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"Error setting secret '{secret_name}' on '{full_name}': {getattr(e, 'stderr', None) or e}")
+        return False
+
 def add_secret(repo_name, secret_name, secret_value):
-    result = run_command(["gh", "secret", "set", secret_name, "--body", secret_value, "--repo", repo_name])
-    if result is None:
+    if set_secret(get_repo_full_name(repo_name), secret_name, secret_value):
         print(f"Secret '{secret_name}' added to repository '{repo_name}'.")
     else:
         print(f"Failed to add secret '{secret_name}' to repository '{repo_name}'.")
 
+def load_secrets_manifest(manifest_path):
+    # {"owner/repo": {"NAME": "value" | {"env": "VAR"} | {"file": "path"}}};
+    # values are resolved up front so a missing variable fails before any upload
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    resolved = {}
+    for repo_name, secrets in manifest.items():
+        values = {}
+        for secret_name, value in secrets.items():
+            if isinstance(value, dict) and "env" in value:
+                if value["env"] not in os.environ:
+                    raise ValueError(f"environment variable '{value['env']}' for {repo_name}/{secret_name} is not set")
+                value = os.environ[value["env"]]
+            elif isinstance(value, dict) and "file" in value:
+                with open(os.path.expanduser(value["file"])) as secret_file:
+                    value = secret_file.read()
+            elif not isinstance(value, str):
+                raise ValueError(f"unsupported value for {repo_name}/{secret_name}")
+            values[secret_name] = value
+        resolved[get_repo_full_name(repo_name)] = values
+    return resolved
+
+def add_secrets(manifest_path, jobs=8):
+    try:
+        manifest = load_secrets_manifest(manifest_path)
+    except (OSError, ValueError) as e:
+        print(f"Error reading secrets manifest '{manifest_path}': {e}")
+        return False
+
+    # Each repository's public key is fetched once per run
+    public_keys = {}
+
+    def provision(full_name):
+        with github_trace.span(full_name):
+            return [secret_name for secret_name, value in manifest[full_name].items() if not set_secret(full_name, secret_name, value, public_keys)]
+
+    failed_repos = 0
+    with ThreadPoolExecutor(max_workers=jobs or 8) as executor:
+        for full_name, failed in zip(manifest, executor.map(provision, manifest)):
+            total = len(manifest[full_name])
+            if failed:
+                failed_repos += 1
+                print(f"FAILED {full_name}: {total - len(failed)}/{total} secrets set, failed: {', '.join(failed)}")
+            else:
+                print(f"OK     {full_name}: {total} secrets set")
+
+    print(f"\n{len(manifest) - failed_repos} of {len(manifest)} repositories provisioned.")
+    return failed_repos == 0
+
 def delete_secret(repo_name, secret_name):
-    result = run_command(["gh", "secret", "remove", secret_name, "--repo", repo_name])
-    if result is None:
+    if github_api.call_api("DELETE", f"repos/{get_repo_full_name(repo_name)}/actions/secrets/{secret_name}"):
         print(f"Secret '{secret_name}' deleted from repository '{repo_name}'.")
     else:
         print(f"Failed to delete secret '{secret_name}' from repository '{repo_name}'.")
 
-def get_repo_stats(repo_name):
-    result = run_command(["gh", "repo", "view", repo_name, "--json", "stargazerCount,forkCount,watchersCount"])
-    if result:
-        stats = json.loads(result)
-        print(f"Stars: {stats['stargazerCount']}, Forks: {stats['forkCount']}, Watchers: {stats['watchersCount']}")
-    else:
-        print(f"Error retrieving statistics for repository '{repo_name}'.")
+def get_repo_stats(repo_names):
+    # Accepts one name or many; every repository is fetched through a batched
+    # GraphQL query instead of one request each
+    if isinstance(repo_names, str):
+        repo_names = [repo_names]
+    full_names = {repo_name: get_repo_full_name(repo_name) for repo_name in repo_names}
+    all_stats = github_api.fetch_repo_stats(full_names.values())
+    for repo_name, full_name in full_names.items():
+        stats = all_stats.get(full_name)
+        prefix = f"{repo_name}: " if len(repo_names) > 1 else ""
+        if stats:
+            print(f"{prefix}Stars: {stats['stars']}, Forks: {stats['forks']}, Watchers: {stats['watchers']}, "
+                  f"Open PRs: {stats['open_pull_requests']}, Open issues: {stats['open_issues']}")
+        else:
+            print(f"Error retrieving statistics for repository '{repo_name}'.")
 
 def create_release(repo_name, tag_name, title, notes):
-    result = run_command(["gh", "release", "create", tag_name, "--title", title, "--notes", notes, "--repo", repo_name])
-    if result is None:
+    body = {"tag_name": tag_name, "name": title, "body": notes}
+    if github_api.call_api("POST", f"repos/{get_repo_full_name(repo_name)}/releases", body):
         print(f"Release '{title}' created for repository '{repo_name}'.")
     else:
         print(f"Failed to create release for repository '{repo_name}'.")
 
 def list_releases(repo_name):
-    result = run_command(["gh", "release", "list", "--repo", repo_name])
-    if result:
-        print(result)
+    response = github_api.call_api("GET", f"repos/{get_repo_full_name(repo_name)}/releases")
+    if response:
+        for release in response.json():
+            print(f"{release['name'] or release['tag_name']}\t{release['tag_name']}\t{release['published_at']}")
     else:
         print(f"Error retrieving releases for repository '{repo_name}'.")
 
 def create_pull_request(repo_name, title, body, base="main", head="HEAD"):
-    result = run_command(["gh", "pr", "create", "--title", title, "--body", body, "--base", base, "--head", head, "--repo", repo_name])
-    if result is None:
+    if head == "HEAD":
+        head = get_default_branch()
+    payload = {"title": title, "body": body, "base": base, "head": head}
+    if github_api.call_api("POST", f"repos/{get_repo_full_name(repo_name)}/pulls", payload):
         print(f"Pull request '{title}' created for repository '{repo_name}'.")
     else:
         print(f"Failed to create pull request for repository '{repo_name}'.")
 
-def list_pull_requests(repo_name):
-    result = run_command(["gh", "pr", "list", "--repo", repo_name, "--json", "title,number,state"])
-    if result:
-        pull_requests = json.loads(result)
-        for pr in pull_requests:
-            print(f"PR #{pr['number']}: {pr['title']} [{pr['state']}]")
-    else:
+def list_pull_requests(repo_name, state="open", limit=None):
+    try:
+        for pr in github_api.iter_items(f"repos/{get_repo_full_name(repo_name)}/pulls", {"state": state}, limit=limit):
+            print(f"PR #{pr['number']}: {pr['title']} [{pr['state'].upper()}]", flush=True)
+    except (github_api.APIError, OSError, http.client.HTTPException):
         print(f"Error retrieving pull requests for repository '{repo_name}'.")
 
 def create_issue(repo_name, title, body):
-    result = run_command(["gh", "issue", "create", "--title", title, "--body", body, "--repo", repo_name])
-    if result is None:
+    if github_api.call_api("POST", f"repos/{get_repo_full_name(repo_name)}/issues", {"title": title, "body": body}):
         print(f"Issue '{title}' created for repository '{repo_name}'.")
     else:
         print(f"Failed to create issue for repository '{repo_name}'.")
 
-def list_issues(repo_name):
-    result = run_command(["gh", "issue", "list", "--repo", repo_name, "--json", "title,number,state"])
-    if result:
-        issues = json.loads(result)
-        for issue in issues:
-            print(f"Issue #{issue['number']}: {issue['title']} [{issue['state']}]")
-    else:
+def list_issues(repo_name, state="open", limit=None):
+    # The issues endpoint also returns pull requests, so the limit is applied
+    # after filtering them out
+    try:
+        items = github_api.iter_items(f"repos/{get_repo_full_name(repo_name)}/issues", {"state": state})
+        issues = (issue for issue in items if "pull_request" not in issue)
+        for issue in itertools.islice(issues, limit):
+            print(f"Issue #{issue['number']}: {issue['title']} [{issue['state'].upper()}]", flush=True)
+    except (github_api.APIError, OSError, http.client.HTTPException):
         print(f"Error retrieving issues for repository '{repo_name}'.")
 
 def add_collaborator(repo_name, collaborator):
-    result = run_command(["gh", "repo", "add-collaborator", collaborator, "--repo", repo_name])
-    if result is None:
+    if github_api.call_api("PUT", f"repos/{get_repo_full_name(repo_name)}/collaborators/{collaborator}", {}):
         print(f"Collaborator '{collaborator}' added to repository '{repo_name}'.")
     else:
         print(f"Failed to add collaborator '{collaborator}' to repository '{repo_name}'.")
 
 def remove_collaborator(repo_name, collaborator):
-    result = run_command(["gh", "repo", "remove-collaborator", collaborator, "--repo", repo_name])
-    if result is None:
+    if github_api.call_api("DELETE", f"repos/{get_repo_full_name(repo_name)}/collaborators/{collaborator}"):
         print(f"Collaborator '{collaborator}' removed from repository '{repo_name}'.")
     else:
         print(f"Failed to remove collaborator '{collaborator}' from repository '{repo_name}'.")
@@ -279,7 +852,7 @@ class CustomHelpFormatter(argparse.HelpFormatter):
         '''
         self.add_text(example_usage)
 
-def main():
+def build_parser():
     parser = argparse.ArgumentParser(
         description="GitHub repository management tool",
         formatter_class=CustomHelpFormatter
@@ -288,9 +861,14 @@ def main():
     # Define arguments as before
     parser.add_argument("--gist", help="Create a Gist from the specified file", metavar="FILE")
     parser.add_argument("--create", help="Create a new repository for the specified directory", metavar="DIR")
-    parser.add_argument("--publish", help="Publish the specified folder to GitHub", metavar="FOLDER")
+    parser.add_argument("--publish", help="Publish the specified folder(s) to GitHub", nargs="+", metavar="FOLDER")
+    parser.add_argument("--publish-all", help="Publish every folder inside DIR (default: ~/Github/experimental)", nargs="?", const=os.path.join(os.path.expanduser("~"), "Github", "experimental"), metavar="DIR")
+    parser.add_argument("--verify-clone", help="After publishing, replace the folder with a fresh clone from GitHub instead of verifying it with ls-remote", action="store_true")
+    parser.add_argument("--jobs", "-j", help="Number of folders processed in parallel in batch modes (default: CPU count)", type=int, metavar="N")
+    parser.add_argument("--network-jobs", help="Maximum concurrent network operations in batch modes (default: 8)", type=int, default=8, metavar="N")
     parser.add_argument("--rename", nargs=2, metavar=('FOLDER', 'NEW_NAME'), help="Rename the specified folder and update GitHub")
-    parser.add_argument("--update", nargs='?', const='.', default=None, metavar="DIR", help="Update the specified directory (default: current directory)")
+    parser.add_argument("--update", nargs='?', const='.', default=None, metavar="DIR", help="Commit and push the changes in DIR, or in every repository directly inside DIR (default: current directory)")
+    parser.add_argument("--fsmonitor", help="Let --update use git's fsmonitor daemon and untracked cache where available", action="store_true")
     parser.add_argument("--message", "-m", help="Commit message for update", default="Update repository")
     parser.add_argument("--set-details", help="Set repository details", metavar="REPO_NAME")
     parser.add_argument("--description", help="Set repository description")
@@ -311,7 +889,8 @@ def main():
     parser.add_argument("--fork", help="Fork the specified repository", metavar="REPO_URL")
     parser.add_argument("--sync-fork", help="Sync a forked repository with upstream", metavar="REPO_NAME")
     parser.add_argument("--enable-pages", help="Enable GitHub Pages for the specified repository", metavar="REPO_NAME")
-    parser.add_argument("--backup", help="Backup the specified repository", nargs=2, metavar=("REPO_NAME", "BACKUP_DIR"))
+    parser.add_argument("--backup", help="Mirror the specified repositories into BACKUP_DIR: REPO_NAME [REPO_NAME ...] BACKUP_DIR", nargs="+", metavar="ARG")
+    parser.add_argument("--backup-all", help="Mirror every repository of the authenticated user into BACKUP_DIR", metavar="BACKUP_DIR")
     parser.add_argument("--license", help="Manage the license for a repository", metavar="REPO_NAME")
     parser.add_argument("--license-type", help="Specify the license type for the repository", default="MIT")
 
@@ -323,8 +902,9 @@ def main():
     parser.add_argument("--mark-notifications-read", help="Mark all notifications as read", action="store_true")
     parser.add_argument("--list-secrets", help="List all secrets in the specified repository", metavar="REPO_NAME")
     parser.add_argument("--add-secret", help="Add a secret to the specified repository", nargs=3, metavar=("REPO_NAME", "SECRET_NAME", "SECRET_VALUE"))
+    parser.add_argument("--add-secrets", help="Set the secrets listed in a JSON manifest of repository -> {name: value} across many repositories", metavar="MANIFEST")
     parser.add_argument("--delete-secret", help="Delete a secret from the specified repository", nargs=2, metavar=("REPO_NAME", "SECRET_NAME"))
-    parser.add_argument("--repo-stats", help="Get statistics for the specified repository", metavar="REPO_NAME")
+    parser.add_argument("--repo-stats", help="Get statistics for the specified repositories", nargs="+", metavar="REPO_NAME")
     parser.add_argument("--create-release", help="Create a new release for the repository", nargs=3, metavar=("REPO_NAME", "TAG_NAME", "TITLE"))
     parser.add_argument("--list-releases", help="List all releases for the specified repository", metavar="REPO_NAME")
     parser.add_argument("--create-pr", help="Create a new pull request", nargs=3, metavar=("REPO_NAME", "TITLE", "BODY"))
@@ -340,8 +920,37 @@ def main():
     parser.add_argument("--disable-action", help="Disable the specified GitHub Action workflow", nargs=2, metavar=("REPO_NAME", "WORKFLOW_NAME"))
     parser.add_argument("--enable-action", help="Enable the specified GitHub Action workflow", nargs=2, metavar=("REPO_NAME", "WORKFLOW_NAME"))
 
-    args = parser.parse_args()
+    # GitHub API access
+    parser.add_argument("--transport", help="How GitHub API calls are made: a pooled in-process HTTP client or one gh subprocess per call (default: http)", choices=["http", "gh"])
+    parser.add_argument("--limit", help="Stop list commands after N items", type=int, metavar="N")
+    parser.add_argument("--state", help="Filter pull requests and issues by state (default: open)", choices=["open", "closed", "all"], default="open")
+    parser.add_argument("--no-cache", help="Bypass the on-disk ETag cache for read-only GitHub API calls", action="store_true")
+    parser.add_argument("--trace", nargs="?", const="1", metavar="FILE", help="Time every command and API call: print the slowest ones to stderr, or write Chrome trace JSON to FILE (also GITHUB_TOOL_TRACE)")
+
+    # Server mode
+    parser.add_argument("--serve", nargs="?", const=github_client.default_socket_path(), metavar="SOCKET", help="Keep running and execute commands sent by github_client.py over a Unix socket (default: %(const)s); commands run with the server's environment")
+    return parser
+
+def command_label(argv):
+    # Commands are traced under the name of the first option given, e.g. "publish-all"
+    options = [arg.lstrip("-").split("=")[0] for arg in argv if arg.startswith("--")]
+    return next((option for option in options if option not in GLOBAL_OPTIONS), "github_tool")
+
+@contextlib.contextmanager
+def command_options(args):
+    # --transport and --no-cache only last for one command, so a server keeps
+    # its pooled transport and response cache for the next one
+    transport = github_api.create_transport(args.transport) if args.transport else None
+    cache_enabled = github_api.response_cache_enabled()
+    with github_api.transport_override(transport):
+        if args.no_cache:
+            github_api.set_response_cache_enabled(False)
+        try:
+            yield
+        finally:
+            github_api.set_response_cache_enabled(cache_enabled)
 
+def dispatch(args, parser):
     # Ensure GitHub CLI is installed and authenticated
     check_gh_installed()
     check_gh_auth()
@@ -352,12 +961,18 @@ def main():
     elif args.create:
         create_repo(args.create)
     elif args.publish:
-        full_path = get_full_path(args.publish)
-        publish_repo(full_path)
+        if len(args.publish) == 1:
+            publish_repo(get_full_path(args.publish[0]), args.verify_clone)
+        elif not publish_many([get_full_path(folder) for folder in args.publish], args.jobs, args.network_jobs, args.verify_clone):
+            sys.exit(1)
+    elif args.publish_all:
+        if not publish_many(find_unpublished_folders(args.publish_all), args.jobs, args.network_jobs, args.verify_clone):
+            sys.exit(1)
     elif args.rename:
         rename_folder(args.rename[0], args.rename[1])
     elif args.update is not None:
-        update_repo(args.update, args.message)
+        if not update_repo(args.update, args.message, args.jobs, args.network_jobs, args.fsmonitor):
+            sys.exit(1)
     elif args.set_details:
         set_repo_details(args.set_details, args.description, args.website, args.topics)
 
@@ -365,7 +980,7 @@ def main():
     elif args.clone:
         clone_repo(args.clone[0], args.clone[1])
     elif args.list:
-        list_repos(args.list)
+        list_repos(args.list, args.limit)
     elif args.delete:
         delete_repo(args.delete)
     elif args.create_branch:
@@ -387,10 +1002,55 @@ def main():
     elif args.enable_pages:
         enable_github_pages(args.enable_pages)
     elif args.backup:
-        backup_repo(args.backup[0], args.backup[1])
+        if len(args.backup) < 2:
+            parser.error("--backup needs at least one REPO_NAME and a BACKUP_DIR")
+        if not backup_repos(args.backup[:-1], args.backup[-1], args.jobs or 8):
+            sys.exit(1)
+    elif args.backup_all:
+        if not backup_account(args.backup_all, args.jobs or 8):
+            sys.exit(1)
     elif args.license:
         manage_license(args.license, args.license_type)
 
+    # Gists, notifications, secrets, releases, PRs, issues and collaborators
+    elif args.list_gists:
+        list_gists(args.limit)
+    elif args.edit_gist:
+        edit_gist(args.edit_gist[0], args.edit_gist[1])
+    elif args.delete_gist:
+        delete_gist(args.delete_gist)
+    elif args.list_notifications:
+        list_notifications()
+    elif args.mark_notifications_read:
+        mark_notifications_as_read()
+    elif args.list_secrets:
+        list_secrets(args.list_secrets)
+    elif args.add_secret:
+        add_secret(args.add_secret[0], args.add_secret[1], args.add_secret[2])
+    elif args.add_secrets:
+        if not add_secrets(args.add_secrets, args.jobs or 8):
+            sys.exit(1)
+    elif args.delete_secret:
+        delete_secret(args.delete_secret[0], args.delete_secret[1])
+    elif args.repo_stats:
+        get_repo_stats(args.repo_stats)
+    elif args.create_release:
+        create_release(args.create_release[0], args.create_release[1], args.create_release[2], "")
+    elif args.list_releases:
+        list_releases(args.list_releases)
+    elif args.create_pr:
+        create_pull_request(args.create_pr[0], args.create_pr[1], args.create_pr[2])
+    elif args.list_prs:
+        list_pull_requests(args.list_prs, args.state, args.limit)
+    elif args.create_issue:
+        create_issue(args.create_issue[0], args.create_issue[1], args.create_issue[2])
+    elif args.list_issues:
+        list_issues(args.list_issues, args.state, args.limit)
+    elif args.add_collaborator:
+        add_collaborator(args.add_collaborator[0], args.add_collaborator[1])
+    elif args.remove_collaborator:
+        remove_collaborator(args.remove_collaborator[0], args.remove_collaborator[1])
+
     # GitHub Actions management
     elif args.list_actions:
         list_actions(args.list_actions)
@@ -404,6 +1064,106 @@ def main():
     else:
         parser.print_help()
 
+def execute_request(parser, argv, cwd):
+    # Runs one command line inside the server exactly like a fresh process
+    # would and returns (status, stdout, stderr)
+    stdout, stderr = io.StringIO(), io.StringIO()
+    status = 0
+    with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+        try:
+            os.chdir(cwd)
+            args = parser.parse_args(argv)
+            if args.serve or args.trace:
+                parser.error("--serve and --trace apply to the whole server, not to a single command")
+            with command_options(args), github_trace.span(command_label(argv)):
+                dispatch(args, parser)
+        except SystemExit as e:
+            if isinstance(e.code, str):
+                print(e.code, file=sys.stderr)
+            status = e.code if isinstance(e.code, int) else int(e.code is not None)
+        except Exception:
+            traceback.print_exc()
+            status = 1
+    github_trace.flush()
+    return status, stdout.getvalue(), stderr.getvalue()
+
+def handle_connection(conn, parser, executor, stop):
+    # Requests on one connection are answered in order, which is what lets a
+    # client pipeline a whole batch without waiting for each reply
+    with conn, conn.makefile("rb") as reader, conn.makefile("wb") as writer:
+        for line in reader:
+            try:
+                request = json.loads(line)
+            except ValueError:
+                response = {"status": 2, "stdout": "", "stderr": "Invalid request\n"}
+            else:
+                op = request.get("op", "run")
+                if op == "ping":
+                    response = {"status": 0, "pid": os.getpid()}
+                elif op == "shutdown":
+                    stop.set()
+                    response = {"status": 0}
+                else:
+                    status, stdout, stderr = executor.submit(execute_request, parser, request.get("argv", []), request.get("cwd") or os.getcwd()).result()
+                    response = {"status": status, "stdout": stdout, "stderr": stderr}
+                response["id"] = request.get("id")
+            writer.write(json.dumps(response).encode() + b"\n")
+            writer.flush()
+
+def serve(socket_path):
+    # Requests chdir into the client's directory, so a relative path would
+    # point somewhere else by the time the socket is removed
+    socket_path = os.path.abspath(socket_path)
+    if os.path.exists(socket_path):
+        if github_client.ping(socket_path):
+            print(f"A server is already listening on {socket_path}.")
+            sys.exit(1)
+        os.remove(socket_path)
+    os.makedirs(os.path.dirname(socket_path), exist_ok=True)
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    umask = os.umask(0o177)
+    try:
+        server.bind(socket_path)
+    finally:
+        os.umask(umask)
+    server.listen()
+    server.settimeout(0.5)
+
+    # Commands run one at a time on a single thread: they share the process
+    # working directory and sys.stdout, and the thread keeps its keep-alive
+    # HTTP connection from one command to the next
+    parser = build_parser()
+    executor = ThreadPoolExecutor(max_workers=1)
+    executor.submit(get_session).result()
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    print(f"Serving github_tool commands on {socket_path} (pid {os.getpid()})", file=sys.stderr, flush=True)
+    try:
+        while not stop.is_set():
+            try:
+                conn, _ = server.accept()
+            except socket.timeout:
+                continue
+            conn.settimeout(None)
+            threading.Thread(target=handle_connection, args=(conn, parser, executor, stop), daemon=True).start()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        os.remove(socket_path)
+        executor.shutdown()
+
+def main():
+    parser = build_parser()
+    args = parser.parse_args()
+    github_trace.start(args.trace, "serve" if args.serve else command_label(sys.argv[1:]))
+    if args.serve:
+        serve(args.serve)
+        return
+    with command_options(args):
+        dispatch(args, parser)
+
 if __name__ == "__main__":
     main()
 
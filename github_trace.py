@@ -0,0 +1,208 @@
+import atexit
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+# Opt-in tracing of every external command and GitHub API call. Enabled with
+# --trace or GITHUB_TOOL_TRACE: "1" prints the slowest calls to stderr when the
+# process exits, any other value is a file that receives Chrome trace-event
+# JSON (chrome://tracing, Perfetto). Worker processes inherit the settings
+# through the environment and append their events to a spool file that the
+# parent merges at exit.
+TRACE_ENV = "GITHUB_TOOL_TRACE"
+SPOOL_ENV = "GITHUB_TOOL_TRACE_SPOOL"
+OWNER_ENV = "GITHUB_TOOL_TRACE_OWNER"
+TOP_ENV = "GITHUB_TOOL_TRACE_TOP"
+SUMMARY_TARGETS = ("1", "true", "yes", "summary")
+
+_events = []
+_events_lock = threading.Lock()
+_spool = None
+_local = threading.local()
+_root_label = None
+
+def enabled():
+    # start() sets up the spool; GITHUB_TOOL_TRACE alone (library use, an
+    # in-process benchmark) records nothing
+    return bool(os.environ.get(SPOOL_ENV) and os.environ.get(OWNER_ENV))
+
+def start(target=None, label=None):
+    # Called once by each CLI; target comes from --trace and falls back to
+    # the environment variable
+    global _root_label
+    target = target or os.environ.get(TRACE_ENV)
+    if not target:
+        return
+    # The --serve process changes directory for every request, so a relative
+    # file is resolved once, against the directory it was started in
+    if target.lower() not in SUMMARY_TARGETS:
+        target = os.path.abspath(target)
+    _root_label = label
+    if os.environ.get(OWNER_ENV) and os.environ.get(OWNER_ENV) != str(os.getpid()):
+        return
+    fd, spool_path = tempfile.mkstemp(prefix="github-trace-", suffix=".jsonl")
+    os.close(fd)
+    os.environ.update({TRACE_ENV: target, SPOOL_ENV: spool_path, OWNER_ENV: str(os.getpid())})
+    atexit.register(report)
+
+def current_label():
+    # Worker threads start with an empty stack and fall back to the command
+    labels = ([_root_label] if _root_label else []) + getattr(_local, "stack", [])
+    return "/".join(labels) or None
+
+def record(event):
+    global _spool
+    if os.environ.get(OWNER_ENV) == str(os.getpid()):
+        with _events_lock:
+            _events.append(event)
+        return
+    with _events_lock:
+        if _spool is None:
+            _spool = open(os.environ[SPOOL_ENV], "a", buffering=1)
+        _spool.write(json.dumps(event) + "\n")
+
+def flush():
+    # Moves the owner's buffered events to the spool, so a long-running
+    # --serve process does not keep every event of every request in memory
+    with _events_lock:
+        if not _events or not enabled():
+            return
+        lines = "".join(json.dumps(event) + "\n" for event in _events)
+        _events.clear()
+        with open(os.environ[SPOOL_ENV], "a") as f:
+            f.write(lines)
+
+class Call:
+    # Filled in by the caller while the command runs; anything left unset is
+    # reported as unknown
+    def __init__(self):
+        self.status = None
+        self.stdout_bytes = 0
+        self.stderr_bytes = 0
+
+    def finish(self, result):
+        # Accepts a CompletedProcess or a CalledProcessError
+        self.status = result.returncode
+        self.stdout_bytes = byte_length(result.stdout)
+        self.stderr_bytes = byte_length(result.stderr)
+
+def byte_length(output):
+    if output is None:
+        return 0
+    if isinstance(output, str):
+        return len(output.encode("utf-8", "replace"))
+    return len(output)
+
+@contextlib.contextmanager
+def command(args, cwd=None, kind="command"):
+    if not enabled():
+        yield Call()
+        return
+    call = Call()
+    name = args if isinstance(args, str) else " ".join(str(arg) for arg in args)
+    start_time = time.time()
+    start_counter = time.perf_counter()
+    try:
+        yield call
+    finally:
+        record({
+            "kind": kind,
+            "name": name,
+            "label": current_label(),
+            "cwd": cwd,
+            "start": int(start_time * 1e6),
+            "duration": int((time.perf_counter() - start_counter) * 1e6),
+            "status": call.status,
+            "stdout_bytes": call.stdout_bytes,
+            "stderr_bytes": call.stderr_bytes,
+            "pid": os.getpid(),
+            "tid": threading.get_native_id(),
+        })
+
+@contextlib.contextmanager
+def span(label):
+    # Attributes the commands run inside it to a metric or command name;
+    # nested spans are joined with "/"
+    if not enabled():
+        yield
+        return
+    stack = _local.__dict__.setdefault("stack", [])
+    stack.append(label)
+    start_time = time.time()
+    start_counter = time.perf_counter()
+    try:
+        yield
+    finally:
+        record({
+            "kind": "span",
+            "name": label,
+            "label": current_label(),
+            "start": int(start_time * 1e6),
+            "duration": int((time.perf_counter() - start_counter) * 1e6),
+            "pid": os.getpid(),
+            "tid": threading.get_native_id(),
+        })
+        stack.pop()
+
+def collect_events():
+    events = list(_events)
+    spool_path = os.environ.get(SPOOL_ENV)
+    if spool_path:
+        try:
+            with open(spool_path) as f:
+                events.extend(json.loads(line) for line in f if line.strip())
+            os.remove(spool_path)
+        except (OSError, ValueError):
+            pass
+    return sorted(events, key=lambda event: event["start"])
+
+def write_chrome_trace(events, path):
+    trace_events = []
+    for event in events:
+        args = {key: event[key] for key in ("label", "cwd", "status", "stdout_bytes", "stderr_bytes") if event.get(key) is not None}
+        trace_events.append({"name": event["name"], "cat": event["kind"], "ph": "X", "ts": event["start"], "dur": event["duration"], "pid": event["pid"], "tid": event["tid"], "args": args})
+    with open(path, "w") as f:
+        json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f)
+
+def print_summary(events, out=sys.stderr):
+    calls = [event for event in events if event["kind"] != "span"]
+    if not calls:
+        print("\nTrace: no commands were run.", file=out)
+        return
+    top = int(os.environ.get(TOP_ENV) or 20)
+    total = sum(event["duration"] for event in calls) / 1e6
+    wall = (max(event["start"] + event["duration"] for event in events) - min(event["start"] for event in events)) / 1e6
+    print(f"\nTrace: {len(calls)} calls, {total:.3f} s in calls, {wall:.3f} s wall", file=out)
+
+    print(f"\nSlowest {min(top, len(calls))} calls:", file=out)
+    print(f"{'ms':>10} {'exit':>5} {'stdout':>10} {'stderr':>8}  {'label':24} command", file=out)
+    for event in sorted(calls, key=lambda event: event["duration"], reverse=True)[:top]:
+        status = "-" if event["status"] is None else event["status"]
+        name = event["name"] if len(event["name"]) <= 80 else event["name"][:77] + "..."
+        print(f"{event['duration'] / 1000:10.1f} {status:>5} {event['stdout_bytes']:>10} {event['stderr_bytes']:>8}  {event['label'] or '-':24} {name}", file=out)
+
+    # Totals per innermost label, so one metric is comparable across repos
+    totals = defaultdict(lambda: [0, 0, 0])
+    for event in calls:
+        entry = totals[(event["label"] or "-").rsplit("/", 1)[-1]]
+        entry[0] += 1
+        entry[1] += event["duration"]
+        entry[2] += event["stdout_bytes"]
+    print("\nBy label:", file=out)
+    print(f"{'calls':>6} {'total ms':>10} {'stdout':>12}  label", file=out)
+    for label, (count, duration, stdout_bytes) in sorted(totals.items(), key=lambda item: item[1][1], reverse=True):
+        print(f"{count:>6} {duration / 1000:10.1f} {stdout_bytes:>12}  {label}", file=out)
+
+def report():
+    target = os.environ.get(TRACE_ENV, "")
+    events = collect_events()
+    if target.lower() in SUMMARY_TARGETS:
+        print_summary(events)
+    else:
+        write_chrome_trace(events, target)
+        print(f"Trace with {len(events)} events written to {target}", file=sys.stderr)